@@ -79,6 +79,47 @@ if 'processing_error' not in st.session_state:
     st.session_state.processing_error = None
 if 'unique_id' not in st.session_state:
     st.session_state.unique_id = str(uuid.uuid4())
+if 'reference_paths' not in st.session_state:
+    st.session_state.reference_paths = []
+if 'reference_uploads' not in st.session_state:
+    st.session_state.reference_uploads = {}
+if 'voiceover_variants' not in st.session_state:
+    st.session_state.voiceover_variants = []
+if 'variant_preview_paths' not in st.session_state:
+    st.session_state.variant_preview_paths = []
+if 'selected_variant' not in st.session_state:
+    st.session_state.selected_variant = 0
+if 'refine_history' not in st.session_state:
+    st.session_state.refine_history = []
+if 'captions_path' not in st.session_state:
+    st.session_state.captions_path = None
+if 'language_tracks' not in st.session_state:
+    st.session_state.language_tracks = {}
+if 'source_language' not in st.session_state:
+    st.session_state.source_language = "English"
+if 'uploaded_video_name' not in st.session_state:
+    st.session_state.uploaded_video_name = None
+if 'artifact_keys' not in st.session_state:
+    st.session_state.artifact_keys = []
+if 'volume_preview_tracks' not in st.session_state:
+    st.session_state.volume_preview_tracks = None
+if 'volume_preview_mix' not in st.session_state:
+    st.session_state.volume_preview_mix = None
+
+# Keep an artifact from being evicted while this session uses it. Pass acquired=True for
+# paths returned with acquire=True, whose reference was taken when they were stored
+def hold_artifact(path, acquired=False):
+    if path is None:
+        return path
+    key = artifact_store.key_for_path(path)
+    if key in st.session_state.artifact_keys:
+        if acquired:
+            artifact_store.release(key)  # this session already holds one reference
+    else:
+        if not acquired:
+            artifact_store.acquire(key)
+        st.session_state.artifact_keys.append(key)
+    return path
 
 # Function to reset the app state
 def reset_app_state():
@@ -91,6 +132,22 @@ def reset_app_state():
     st.session_state.processing_complete = False
     st.session_state.processing_error = None
     st.session_state.unique_id = str(uuid.uuid4())
+    st.session_state.reference_paths = []
+    st.session_state.reference_uploads = {}
+    st.session_state.voiceover_variants = []
+    st.session_state.variant_preview_paths = []
+    st.session_state.selected_variant = 0
+    st.session_state.refine_history = []
+    st.session_state.captions_path = None
+    st.session_state.language_tracks = {}
+    st.session_state.uploaded_video_name = None
+    st.session_state.volume_preview_tracks = None
+    st.session_state.volume_preview_mix = None
+    
+    # Release this session's artifacts; shared files stay until the store evicts them
+    for key in st.session_state.artifact_keys:
+        artifact_store.release(key)
+    st.session_state.artifact_keys = []
     
     # Clear temp directory
     if os.path.exists(st.session_state.temp_dir):
@@ -103,41 +160,122 @@ def reset_app_state():
                 st.error(f"Error deleting file {file_path}: {e}")
 
 # Generate voiceover text based on video content and instructions
-def process_video_for_text(video_path, instructions):
+def process_video_for_text(video_path, instructions, reference_paths=None, n_variants=1, reference_names=None):
     try:
         st.session_state.current_step = 2
         with st.spinner("Analyzing video content and generating voiceover text..."):
-            voiceover_text = generate_voiceover_text(video_path, instructions)
-            st.session_state.voiceover_text = voiceover_text
+            result = generate_voiceover_text(video_path, instructions, reference_paths, n_variants=n_variants,
+                                             reference_names=reference_names)
+            variants = result if isinstance(result, list) else [result]
+            st.session_state.voiceover_variants = variants
+            st.session_state.variant_preview_paths = []
+            st.session_state.selected_variant = 0
+            st.session_state.pop("variant_choice", None)  # reset the take picker for the new takes
+            st.session_state.refine_history = []
+            st.session_state.voiceover_text = variants[0]
             st.session_state.current_step = 3
-        return voiceover_text
+        if len(variants) > 1:
+            with st.spinner(f"Synthesizing previews of {len(variants)} takes..."):
+                preview_paths = generate_variant_previews(variants, acquire=True)
+                st.session_state.variant_preview_paths = [hold_artifact(path, acquired=True) for path in preview_paths]
+        return st.session_state.voiceover_text
     except Exception as e:
         st.session_state.processing_error = f"Error generating voiceover text: {str(e)}"
         return None
 
+# Revise the voiceover text from user feedback, reusing the cached video analysis
+def refine_script(video_path, current_text, feedback):
+    try:
+        history = st.session_state.refine_history
+        if not history:
+            history.append({"role": "assistant", "content": current_text})
+        elif history[-1]["content"] != current_text:
+            # Keep hand edits made in the text area between refinements
+            history.append({"role": "user", "content": f"I edited the script by hand. Current version:\n{current_text}"})
+        with st.spinner("Refining voiceover text..."):
+            st.session_state.voiceover_text = refine_voiceover_text(video_path, history, feedback)
+        return st.session_state.voiceover_text
+    except Exception as e:
+        st.session_state.processing_error = f"Error refining voiceover text: {str(e)}"
+        return None
+
 # Generate audio from voiceover text
-def generate_audio(voiceover_text, voice_name, speed):
+def generate_audio(voiceover_text, voice_name, speed, with_captions=False, source_language="English", extra_languages=None):
     try:
         st.session_state.current_step = 4
-        audio_path = os.path.join(st.session_state.temp_dir, f"voiceover_{st.session_state.unique_id}.mp3")
-        with st.spinner("Converting text to speech..."):
-            generate_voiceover_audio_elevenlabs(voiceover_text, 
-            audio_path)
+        extra_languages = extra_languages or []
+        spinner_text = "Converting text to speech..."
+        if extra_languages:
+            spinner_text = f"Converting text to speech and voicing {len(extra_languages)} more languages..."
+        with st.spinner(spinner_text):
+            # The source language is voiced alongside the translations rather than before them
+            language_tracks = generate_multilingual_voiceovers(
+                voiceover_text,
+                [source_language] + extra_languages,
+                source_language=source_language,
+                with_captions=with_captions,
+                acquire=True
+            )
+            for track in language_tracks.values():
+                hold_artifact(track["audio_path"], acquired=True)
+                hold_artifact(track["captions_path"], acquired=True)
+            source_track = language_tracks.pop(source_language)
+            audio_path = source_track["audio_path"]
             st.session_state.audio_path = audio_path
-            st.session_state.current_step = 5
+            st.session_state.captions_path = source_track["captions_path"]
+            st.session_state.volume_preview_tracks = None
+            st.session_state.volume_preview_mix = None
+            st.session_state.source_language = source_language
+            st.session_state.language_tracks = language_tracks
+        st.session_state.current_step = 5
         return audio_path
     except Exception as e:
         st.session_state.processing_error = f"Error generating audio: {str(e)}"
         return None
 
+# Re-mix the decoded preview tracks at the current slider levels (decoding only happens once per voiceover)
+# and put the mix on the start of the preview proxy, or return just the audio without one
+def preview_volume_mix(video_path, audio_path, video_volume, audio_volume, proxy_path=None):
+    sources = (video_path, audio_path)
+    preview_tracks = st.session_state.volume_preview_tracks
+    if preview_tracks is None or preview_tracks["sources"] != sources:
+        try:
+            preview_tracks = {"sources": sources, "tracks": load_volume_preview_tracks(video_path, audio_path)}
+        except Exception as e:
+            # Remember the failure so every slider move doesn't retry the decode
+            preview_tracks = {"sources": sources, "tracks": None, "error": str(e)}
+        st.session_state.volume_preview_tracks = preview_tracks
+        st.session_state.volume_preview_mix = None
+    if preview_tracks["tracks"] is None:
+        st.warning(f"Volume preview unavailable: {preview_tracks['error']}")
+        return None
+
+    settings = (video_volume, audio_volume, proxy_path)
+    if st.session_state.volume_preview_mix is None or st.session_state.volume_preview_mix[0] != settings:
+        try:
+            preview = mix_volume_preview(preview_tracks["tracks"], video_volume, audio_volume, proxy_path)
+        except Exception as e:
+            st.warning(f"Volume preview unavailable: {e}")
+            return None
+        st.session_state.volume_preview_mix = (settings, preview)
+    return st.session_state.volume_preview_mix[1]
+
 # Merge video with audio
-def merge_video_audio(video_path, audio_path, video_volume, audio_volume):
+def merge_video_audio(video_path, audio_path, video_volume, audio_volume, subtitle_path=None):
     try:
         st.session_state.current_step = 7
-        merged_path = os.path.join(st.session_state.temp_dir, f"merged_{st.session_state.unique_id}.mp4")
         with st.spinner("Merging video with voiceover audio..."):
-            merge_video_with_audio(video_path, audio_path, merged_path, video_volume, audio_volume)
-            st.session_state.merged_video_path = merged_path
+            # One video stream with a tagged audio (and caption) track per language
+            source_language = st.session_state.source_language
+            audio_tracks = {source_language: audio_path}
+            subtitle_tracks = {source_language: subtitle_path}
+            for language, track in st.session_state.language_tracks.items():
+                audio_tracks[language] = track["audio_path"]
+                subtitle_tracks[language] = track["captions_path"]
+            merged_path = render_voiceover_video(video_path, audio_tracks, video_volume, audio_volume, subtitle_tracks,
+                                                 acquire=True)
+            st.session_state.merged_video_path = hold_artifact(merged_path, acquired=True)
+            request_proxy_video(merged_path)  # start rendering the preview in the background
             st.session_state.current_step = 8
             st.session_state.processing_complete = True
         return merged_path
@@ -145,6 +283,22 @@ def merge_video_audio(video_path, audio_path, video_volume, audio_volume):
         st.session_state.processing_error = f"Error merging video with audio: {str(e)}"
         return None
 
+# Wait for a background preview render, then rerun the app to show it
+@st.fragment(run_every=2)
+def wait_for_proxy(video_path):
+    status, _ = request_proxy_video(video_path)
+    if status != "pending":
+        st.rerun()
+    st.info("Preparing a lightweight preview...")
+
+# Preview a video through its low-bitrate proxy; the full file is only served on download
+def show_preview(video_path):
+    status, preview_path = request_proxy_video(video_path, acquire=True)
+    if status == "pending":
+        wait_for_proxy(video_path)
+    else:
+        st.video(hold_artifact(preview_path, acquired=True) if status == "ready" else preview_path)
+
 # Authentication check
 if not st.session_state.authenticated:
     # Login page
@@ -208,11 +362,12 @@ with col1:
     uploaded_file = st.file_uploader("Choose a video file", type=["mp4", "mov", "avi", "wmv"], key="video_uploader")
     
     if uploaded_file is not None and st.session_state.uploaded_video_path is None:
-        # Save uploaded file to temporary directory
-        temp_video_path = os.path.join(st.session_state.temp_dir, f"uploaded_{st.session_state.unique_id}.mp4")
-        with open(temp_video_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        st.session_state.uploaded_video_path = temp_video_path
+        # Save uploaded file to the shared artifact store (identical uploads are stored once)
+        extension = os.path.splitext(uploaded_file.name)[1].lower() or ".mp4"
+        stored_video_path = artifact_store.put_bytes(uploaded_file.getbuffer(), 'video', extension, acquire=True)
+        st.session_state.uploaded_video_path = hold_artifact(stored_video_path, acquired=True)
+        st.session_state.uploaded_video_name = uploaded_file.name
+        request_proxy_video(stored_video_path)  # start rendering the preview in the background
         st.success(f"Video uploaded successfully: {uploaded_file.name}")
     
     # Instructions text area
@@ -223,28 +378,93 @@ with col1:
         height=100
     )
     
+    # Optional reference documents (product briefs, scripts) used as grounding
+    reference_files = st.file_uploader(
+        "Optional: add product briefs or scripts (PDF/DOCX) for the voiceover to draw on",
+        type=["pdf", "docx"],
+        accept_multiple_files=True,
+        key="reference_uploader"
+    )
+    # Store each upload by content, so a revised file with the same name is never mistaken for the old one.
+    # Uploads are remembered by their uploader id so reruns don't hash them again
+    reference_uploads = {}
+    for reference_file in reference_files or []:
+        upload = st.session_state.reference_uploads.get(reference_file.file_id)
+        if upload is None:
+            extension = os.path.splitext(reference_file.name)[1].lower()
+            stored_path = artifact_store.put_bytes(reference_file.getbuffer(), 'reference', extension, acquire=True)
+            upload = (hold_artifact(stored_path, acquired=True), reference_file.name)
+        reference_uploads[reference_file.file_id] = upload
+    st.session_state.reference_uploads = reference_uploads
+    st.session_state.reference_paths = [path for path, _ in reference_uploads.values()]
+    
+    n_variants = st.number_input("Number of takes to generate:", min_value=1, max_value=4, value=1, step=1,
+                                 help="Several takes come from a single video analysis, with a short audio preview of each.")
+    
     # Generate voiceover text button
     if st.session_state.uploaded_video_path is not None and st.button("Generate Voiceover Text", key="generate_text_button"):
         if not instructions:
             st.warning("Please provide instructions for the voiceover style and content.")
         else:
             st.session_state.is_processing = True
-            process_video_for_text(st.session_state.uploaded_video_path, instructions)
+            process_video_for_text(st.session_state.uploaded_video_path, instructions, st.session_state.reference_paths,
+                                   n_variants=int(n_variants),
+                                   reference_names=dict(st.session_state.reference_uploads.values()))
+    
+    # Choose between takes when several were generated
+    if len(st.session_state.voiceover_variants) > 1:
+        st.markdown('<div class="sub-header">Choose a Take</div>', unsafe_allow_html=True)
+        variants = st.session_state.voiceover_variants
+        preview_paths = st.session_state.variant_preview_paths
+        for i, variant in enumerate(variants):
+            with st.expander(f"Take {i + 1}", expanded=(i == st.session_state.selected_variant)):
+                st.write(variant)
+                if i < len(preview_paths) and preview_paths[i] and os.path.exists(preview_paths[i]):
+                    st.audio(preview_paths[i], format="audio/mp3")
+        selected = st.radio("Use take:", list(range(len(variants))), format_func=lambda i: f"Take {i + 1}",
+                            index=st.session_state.selected_variant, horizontal=True, key="variant_choice")
+        if selected != st.session_state.selected_variant:
+            st.session_state.selected_variant = selected
+            st.session_state.voiceover_text = variants[selected]
+            st.session_state.refine_history = []
     
     # Display and edit voiceover text
     if st.session_state.voiceover_text is not None:
         st.markdown('<div class="sub-header">Step 3: Edit Voiceover Script</div>', unsafe_allow_html=True)
         edited_text = st.text_area("Edit the generated voiceover text if needed:", value=st.session_state.voiceover_text, height=200)
         
+        # Conversational refinement; only the first one analyzes the video frames
+        with st.form("refine_form", clear_on_submit=True):
+            feedback = st.text_input("Or ask for changes:", placeholder="e.g. shorter, more upbeat, mention the price")
+            refine_button = st.form_submit_button("Refine Script")
+        if refine_button and feedback.strip():
+            refine_script(st.session_state.uploaded_video_path, edited_text, feedback.strip())
+            st.rerun()
+        
         # Generate audio button
+        with_captions = st.checkbox("Add captions (soft subtitles timed to the voiceover)", value=True, key="captions_checkbox")
+        lang_col1, lang_col2 = st.columns([1, 2])
+        with lang_col1:
+            source_language = st.selectbox("Script language:", list(LANGUAGE_CODES), key="source_language_select")
+        with lang_col2:
+            extra_languages = st.multiselect(
+                "Also produce voiceovers in:",
+                [language for language in LANGUAGE_CODES if language != source_language],
+                key="extra_languages_select",
+                help="Each language becomes its own audio track in the same video file."
+            )
         if st.button("Generate Voiceover Audio", key="generate_audio_button"):
             st.session_state.voiceover_text = edited_text  # Update with edited text
-            generate_audio(edited_text, "nova", 1.0)  # Use default voice and speed
+            generate_audio(edited_text, "nova", 1.0, with_captions, source_language, extra_languages)  # Use default voice and speed
     
     # Display audio player if audio has been generated
     if st.session_state.audio_path is not None and os.path.exists(st.session_state.audio_path):
         st.markdown('<div class="sub-header">Step 4: Preview Voiceover Audio</div>', unsafe_allow_html=True)
         st.audio(st.session_state.audio_path, format="audio/mp3")
+        for language, track in st.session_state.language_tracks.items():
+            with st.expander(f"{language} voiceover"):
+                st.write(track["text"])
+                st.audio(track["audio_path"], format="audio/mp3")
         st.success("✅ Voiceover audio generated successfully! You can play it above and adjust volume settings below.")
     
     # Volume adjustment sliders
@@ -258,13 +478,30 @@ with col1:
         with vol_col2:
             audio_volume = st.slider("Voiceover Volume:", min_value=0.0, max_value=1.0, value=1.0, step=0.1)
         
+        # Instant preview of the levels: the mix on the start of the proxy, no merge needed
+        proxy_status, proxy_path = request_proxy_video(st.session_state.uploaded_video_path, acquire=True)
+        if proxy_status == "pending":
+            wait_for_proxy(st.session_state.uploaded_video_path)
+        else:
+            # Without a proxy the original may not be MP4-compatible, so preview the audio alone
+            proxy_path = hold_artifact(proxy_path, acquired=True) if proxy_status == "ready" else None
+            preview = preview_volume_mix(st.session_state.uploaded_video_path, st.session_state.audio_path,
+                                         video_volume, audio_volume, proxy_path)
+            if preview is not None:
+                st.caption(f"Level preview (first {VOLUME_PREVIEW_SECONDS} seconds)")
+                if proxy_path is not None:
+                    st.video(preview, format="video/mp4")
+                else:
+                    st.audio(preview, format="audio/mp3")
+        
         # Merge button
         if st.button("Merge Video with Voiceover", key="merge_button"):
             merge_video_audio(
                 st.session_state.uploaded_video_path,
                 st.session_state.audio_path,
                 video_volume,
-                audio_volume
+                audio_volume,
+                st.session_state.captions_path
             )
 
 with col2:
@@ -279,13 +516,13 @@ with col2:
     
     with tab1:
         if st.session_state.uploaded_video_path:
-            st.video(st.session_state.uploaded_video_path)
+            show_preview(st.session_state.uploaded_video_path)
         else:
             st.info("Upload a video to see preview")
     
     with tab2:
         if st.session_state.merged_video_path:
-            st.video(st.session_state.merged_video_path)
+            show_preview(st.session_state.merged_video_path)
             
             # Download button for final video
             st.markdown('<div class="sub-header">Step 8: Download Final Video</div>', unsafe_allow_html=True)
@@ -294,11 +531,21 @@ with col2:
                 st.download_button(
                     label="Download Video with Voiceover",
                     data=file,
-                    file_name=f"VoxOver_{Path(st.session_state.uploaded_video_path or 'video').stem}_{st.session_state.unique_id}.mp4",
+                    file_name=f"VoxOver_{Path(st.session_state.uploaded_video_name or 'video').stem}_{st.session_state.unique_id}.mp4",
                     mime="video/mp4",
                     key="download_button"
                 )
             
+            if st.session_state.captions_path and os.path.exists(st.session_state.captions_path):
+                with open(st.session_state.captions_path, "rb") as file:
+                    st.download_button(
+                        label="Download Captions (SRT)",
+                        data=file,
+                        file_name=f"VoxOver_{Path(st.session_state.uploaded_video_name or 'video').stem}_{st.session_state.unique_id}.srt",
+                        mime="application/x-subrip",
+                        key="download_captions_button"
+                    )
+            
             st.markdown('<div class="success-text">✅ Processing complete! Your video with AI voiceover is ready to download.</div>', unsafe_allow_html=True)
         else:
             if st.session_state.current_step >= 3:
@@ -0,0 +1,362 @@
+# Standard library imports
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+# Filesystems on which SQLite's WAL mode (which relies on shared memory) does not work
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', 'ceph', 'glusterfs', 'lustre', '9p'}
+
+
+def _filesystem_type(path):
+    """
+    Returns the type of the filesystem holding `path` (e.g. 'ext4' or 'nfs4'), or None if unknown.
+    """
+    path = os.path.realpath(path)
+    best_mount, best_type = "", None
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) \
+                        and len(mount_point) > len(best_mount):
+                    best_mount, best_type = mount_point, fields[2]
+    except OSError:
+        return None  # not Linux
+    return best_type
+
+
+class LocalDirectoryBackend:
+    """
+    Stores artifact blobs as files under a directory.
+
+    Point several app replicas on the same host at the same directory to let them
+    reuse each other's artifacts. Other backends (object storage, etc.) only need
+    to provide the same methods; `local_path` is where such a backend would
+    download a blob into a local cache.
+
+    Attributes:
+    ----------
+    root : str
+        Directory holding the blobs, sharded by the first two characters of the key.
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key, extension):
+        return os.path.join(self.root, key[:2], f"{key}{extension}")
+
+    def exists(self, key, extension):
+        return os.path.exists(self._path(key, extension))
+
+    def local_path(self, key, extension):
+        return self._path(key, extension)
+
+    def write_file(self, key, extension, source_path, move=False):
+        """
+        Atomically stores a file under `key`.
+
+        The file is first copied (or moved) to a temporary name in the destination
+        directory and then renamed into place, so readers never see a partial file
+        and concurrent writers of the same key simply replace identical content.
+        """
+        destination = self._path(key, extension)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        fd, staging_path = tempfile.mkstemp(dir=os.path.dirname(destination), suffix=".partial")
+        os.close(fd)
+        try:
+            if move:
+                shutil.move(source_path, staging_path)
+            else:
+                shutil.copyfile(source_path, staging_path)
+            os.replace(staging_path, destination)
+        except BaseException:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+            raise
+        return destination
+
+    def write_bytes(self, key, extension, data):
+        """
+        Atomically stores bytes under `key` (see `write_file`).
+        """
+        destination = self._path(key, extension)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        fd, staging_path = tempfile.mkstemp(dir=os.path.dirname(destination), suffix=".partial")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(staging_path, destination)
+        except BaseException:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+            raise
+        return destination
+
+    def delete(self, key, extension):
+        try:
+            os.remove(self._path(key, extension))
+        except FileNotFoundError:
+            pass
+
+
+class ArtifactStore:
+    """
+    A content-addressed store for uploads and generated artifacts, shared by app replicas.
+
+    Uploaded files are keyed by the SHA-256 of their contents. Generated artifacts
+    (frames, TTS audio, merged videos, ...) are keyed by a hash of the inputs that
+    produced them (see `derive_key`), so any replica can find and reuse work that
+    another replica already did. An SQLite index tracks each artifact's size,
+    reference count and last access time for eviction.
+
+    SQLite locking is unreliable on network filesystems, so the index should be on
+    a local disk; replicas share the store by running on the same host. WAL mode is
+    only enabled when the index is on a local filesystem.
+
+    Attributes:
+    ----------
+    backend : object
+        Where blobs are stored (default is a LocalDirectoryBackend under `root`).
+    index_path : str
+        Path to the SQLite index.
+    max_bytes : int or None
+        If set, `evict` trims the store to this size after every `put`.
+    stale_after_s : float
+        References not touched for this long are treated as abandoned by eviction,
+        so sessions that end without releasing their artifacts do not pin them forever.
+    """
+    def __init__(self, root, backend=None, index_path=None, max_bytes=None, stale_after_s=24 * 3600):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.backend = backend or LocalDirectoryBackend(os.path.join(root, "objects"))
+        self.index_path = index_path or os.path.join(root, "index.sqlite3")
+        self._use_wal = _filesystem_type(os.path.dirname(os.path.abspath(self.index_path))) not in NETWORK_FILESYSTEMS
+        self.max_bytes = max_bytes
+        self.stale_after_s = stale_after_s
+        # (path, size, mtime) -> hash, so the same upload is not re-hashed on every rerun
+        self._hash_memo = {}
+        self._hash_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    extension TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    refcount INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        # A connection per operation keeps the store safe to use from Streamlit's session threads
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        if self._use_wal:
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def derive_key(kind, *inputs):
+        """
+        Returns the key for an artifact produced from the given inputs.
+
+        Inputs are converted with `repr`, so pass plain strings, numbers and the
+        keys of input artifacts (not file paths, which differ between replicas).
+        """
+        digest = hashlib.sha256(kind.encode('utf-8'))
+        for value in inputs:
+            digest.update(b"\0")
+            digest.update(repr(value).encode('utf-8'))
+        return digest.hexdigest()
+
+    def hash_file(self, path):
+        """
+        Returns the SHA-256 of a file's contents, memoized by path, size and modification time.
+        """
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._hash_lock:
+            if memo_key in self._hash_memo:
+                return self._hash_memo[memo_key]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        with self._hash_lock:
+            self._hash_memo[memo_key] = digest.hexdigest()
+        return self._hash_memo[memo_key]
+
+    def _record(self, key, kind, extension, acquire=False):
+        now = time.time()
+        size = os.path.getsize(self.backend.local_path(key, extension))
+        # The reference is taken in the same statement that records the artifact, so
+        # no eviction can run between storing it and acquiring it
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO artifacts (key, kind, extension, size, refcount, created, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    refcount = refcount + excluded.refcount,
+                    last_access = excluded.last_access
+            """, (key, kind, extension, size, int(acquire), now, now))
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes, keep=key)
+        return self.backend.local_path(key, extension)
+
+    def put_file(self, path, kind, key=None, move=False, acquire=False):
+        """
+        Stores a file and returns its path in the store.
+
+        Parameters:
+        ----------
+        path : str
+            The file to store. Its extension is kept so tools can detect the format.
+        kind : str
+            A label for the artifact type, e.g. 'video', 'frame', 'tts', 'merged'.
+        key : str, optional
+            Key to store under (from `derive_key`). Defaults to the content hash.
+        move : bool, optional
+            Move the file into the store instead of copying it (default is False).
+        acquire : bool, optional
+            Also take a reference on the artifact, as `acquire` would, atomically with
+            storing it (default is False).
+
+        Returns:
+        -------
+        str
+            Local path of the stored artifact.
+        """
+        key = key or self.hash_file(path)
+        extension = os.path.splitext(path)[1].lower()
+        if not self.backend.exists(key, extension):
+            self.backend.write_file(key, extension, path, move=move)
+        elif move:
+            os.remove(path)
+        return self._record(key, kind, extension, acquire)
+
+    def put_bytes(self, data, kind, extension, key=None, acquire=False):
+        """
+        Stores bytes (e.g. an upload) and returns their path in the store.
+
+        Parameters:
+        ----------
+        data : bytes-like
+            The content to store.
+        kind : str
+            A label for the artifact type.
+        extension : str
+            File extension including the dot, e.g. '.mp4'.
+        key : str, optional
+            Key to store under. Defaults to the content hash.
+        acquire : bool, optional
+            Also take a reference on the artifact (see `put_file`).
+
+        Returns:
+        -------
+        str
+            Local path of the stored artifact.
+        """
+        key = key or hashlib.sha256(data).hexdigest()
+        if not self.backend.exists(key, extension):
+            self.backend.write_bytes(key, extension, bytes(data))
+        return self._record(key, kind, extension, acquire)
+
+    def get(self, key, acquire=False):
+        """
+        Returns the local path of an artifact, or None if it is not in the store.
+
+        With `acquire`, a reference is also taken on the artifact in the same
+        transaction as the lookup, so eviction cannot delete it in between.
+        """
+        with self._connect() as conn:
+            # Take the write lock up front: the lookup and the update are one transaction
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT extension FROM artifacts WHERE key = ?", (key,)).fetchone()
+            if row is None or not self.backend.exists(key, row[0]):
+                return None
+            conn.execute("UPDATE artifacts SET refcount = refcount + ?, last_access = ? WHERE key = ?",
+                         (int(acquire), time.time(), key))
+        return self.backend.local_path(key, row[0])
+
+    def key_for_path(self, path):
+        """
+        Returns the key of an artifact given its path in the store.
+        """
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def staging_path(self, extension):
+        """
+        Returns a fresh path next to the store for producing an artifact before `put_file(..., move=True)`.
+        """
+        staging_dir = os.path.join(self.root, "staging")
+        os.makedirs(staging_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=staging_dir, suffix=extension)
+        os.close(fd)
+        return path
+
+    def acquire(self, key):
+        """
+        Marks an artifact as in use so eviction keeps it.
+        """
+        with self._connect() as conn:
+            conn.execute("UPDATE artifacts SET refcount = refcount + 1, last_access = ? WHERE key = ?",
+                         (time.time(), key))
+
+    def release(self, key):
+        """
+        Drops a reference taken with `acquire`.
+        """
+        with self._connect() as conn:
+            conn.execute("UPDATE artifacts SET refcount = MAX(refcount - 1, 0) WHERE key = ?", (key,))
+
+    def total_bytes(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+
+    def evict(self, max_bytes, keep=None):
+        """
+        Deletes least recently used artifacts until the store is at most `max_bytes`.
+
+        Artifacts with references are skipped unless they have not been accessed for
+        `stale_after_s` seconds. The artifact with key `keep` (e.g. the one just
+        stored) is never deleted.
+
+        Returns:
+        -------
+        int
+            Number of bytes freed.
+        """
+        stale_before = time.time() - self.stale_after_s
+        freed = 0
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+            if total <= max_bytes:
+                return 0
+            candidates = conn.execute("""
+                SELECT key, extension, size FROM artifacts
+                WHERE (refcount = 0 OR last_access < ?) AND key IS NOT ?
+                ORDER BY last_access ASC
+            """, (stale_before, keep)).fetchall()
+            for key, extension, size in candidates:
+                if total - freed <= max_bytes:
+                    break
+                # Check again as the row is deleted: the artifact may have been acquired
+                # since the candidates were listed. The blob is only removed if the row was.
+                with conn:
+                    deleted = conn.execute("""
+                        DELETE FROM artifacts WHERE key = ? AND (refcount = 0 OR last_access < ?)
+                    """, (key, stale_before)).rowcount
+                    if deleted:
+                        self.backend.delete(key, extension)
+                if deleted:
+                    freed += size
+        return freed
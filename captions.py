@@ -0,0 +1,221 @@
+# Standard library imports
+import os
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from ffmpeg_tools import decode_audio
+
+
+def words_from_character_alignment(characters, start_times, end_times):
+    """
+    Groups character-level TTS timings into word timings.
+
+    Parameters:
+    ----------
+    characters : list
+        The characters of the synthesized text, one per entry.
+    start_times, end_times : list
+        Start and end time in seconds of each character.
+
+    Returns:
+    -------
+    list
+        One dict per word with keys 'text', 'start' and 'end'.
+    """
+    words = []
+    current, word_start, word_end = "", None, None
+    for char, start, end in zip(characters, start_times, end_times):
+        if char.isspace():
+            if current:
+                words.append({'text': current, 'start': word_start, 'end': word_end})
+            current, word_start = "", None
+            continue
+        if word_start is None:
+            word_start = start
+        current += char
+        word_end = end
+    if current:
+        words.append({'text': current, 'start': word_start, 'end': word_end})
+    return words
+
+
+def _speech_segments(samples, sample_rate, frame_s=0.02, min_pause_s=0.15):
+    """
+    Finds the spans of an audio signal that contain speech, using frame energy.
+
+    Returns:
+    -------
+    list
+        (start, end) times in seconds of each speech segment.
+    """
+    frame_len = max(1, int(sample_rate * frame_s))
+    num_frames = len(samples) // frame_len
+    if num_frames == 0:
+        return []
+    frames = samples[:num_frames * frame_len].reshape(num_frames, frame_len)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    # Relative to the loud parts of the track, so it works at any output level
+    threshold = max(np.percentile(rms, 95) * 0.1, 1e-4)
+    voiced = rms > threshold
+
+    segments = []
+    start = None
+    silent_run = 0
+    min_pause_frames = int(min_pause_s / frame_s)
+    for i, is_voiced in enumerate(voiced):
+        if is_voiced:
+            if start is None:
+                start = i
+            silent_run = 0
+        elif start is not None:
+            silent_run += 1
+            if silent_run >= min_pause_frames:
+                segments.append((start * frame_s, (i - silent_run + 1) * frame_s))
+                start, silent_run = None, 0
+    if start is not None:
+        segments.append((start * frame_s, (num_frames - silent_run) * frame_s))
+    return segments
+
+
+def estimate_word_timings(text, audio_path, sample_rate=16000):
+    """
+    Approximately aligns the words of a script to its synthesized audio.
+
+    This is a local fallback for TTS engines that do not return timing data. Speech
+    segments are found from the audio energy, and words are spread across them in
+    proportion to their length in characters, so pauses between sentences line up
+    with silences in the audio. It is good enough for captions, not for lip sync.
+
+    Parameters:
+    ----------
+    text : str
+        The script that was synthesized.
+    audio_path : str
+        Path to the synthesized audio.
+    sample_rate : int, optional
+        Sample rate to analyze the audio at (default is 16000).
+
+    Returns:
+    -------
+    list
+        One dict per word with keys 'text', 'start' and 'end'.
+    """
+    tokens = text.split()
+    if not tokens:
+        return []
+    samples = decode_audio(audio_path, sample_rate=sample_rate)
+    segments = _speech_segments(samples, sample_rate)
+    if not segments:
+        segments = [(0.0, len(samples) / sample_rate)]
+
+    # Map positions along the script (in characters, +1 for the gap after each word)
+    # onto positions along the concatenated speech segments (in seconds)
+    weights = [len(token) + 1 for token in tokens]
+    total_weight = sum(weights)
+    speech_total = sum(end - start for start, end in segments)
+
+    def to_time(fraction):
+        remaining = fraction * speech_total
+        for start, end in segments:
+            if remaining <= end - start:
+                return start + remaining
+            remaining -= end - start
+        return segments[-1][1]
+
+    words = []
+    position = 0
+    for token, weight in zip(tokens, weights):
+        start = to_time(position / total_weight)
+        end = to_time((position + weight - 1) / total_weight)
+        words.append({'text': token, 'start': start, 'end': end})
+        position += weight
+    return words
+
+
+def group_words_into_cues(words, max_chars=42, max_duration=4.0):
+    """
+    Groups timed words into caption cues.
+
+    A cue ends at sentence punctuation, or when adding the next word would exceed
+    `max_chars` characters or `max_duration` seconds.
+
+    Returns:
+    -------
+    list
+        One dict per cue with keys 'text', 'start' and 'end'.
+    """
+    cues = []
+    current = []
+    for word in words:
+        if current:
+            text = " ".join(w['text'] for w in current + [word])
+            if len(text) > max_chars or word['end'] - current[0]['start'] > max_duration:
+                cues.append(current)
+                current = []
+        current.append(word)
+        if word['text'][-1] in ".!?":
+            cues.append(current)
+            current = []
+    if current:
+        cues.append(current)
+    return [{'text': " ".join(w['text'] for w in cue), 'start': cue[0]['start'], 'end': cue[-1]['end']}
+            for cue in cues]
+
+
+def _format_timestamp(seconds, separator):
+    milliseconds = int(round(max(seconds, 0.0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def format_srt(cues):
+    """
+    Formats caption cues as an SRT document.
+    """
+    blocks = []
+    for i, cue in enumerate(cues, start=1):
+        blocks.append(f"{i}\n{_format_timestamp(cue['start'], ',')} --> {_format_timestamp(cue['end'], ',')}\n{cue['text']}\n")
+    return "\n".join(blocks)
+
+
+def format_webvtt(cues):
+    """
+    Formats caption cues as a WebVTT document.
+    """
+    blocks = ["WEBVTT\n"]
+    for cue in cues:
+        blocks.append(f"{_format_timestamp(cue['start'], '.')} --> {_format_timestamp(cue['end'], '.')}\n{cue['text']}\n")
+    return "\n".join(blocks)
+
+
+def write_captions(words, captions_path):
+    """
+    Writes timed words to a caption file, as SRT or WebVTT depending on the extension.
+
+    Parameters:
+    ----------
+    words : list
+        Timed words, as returned by `words_from_character_alignment` or `estimate_word_timings`.
+    captions_path : str
+        Output path ending in .srt or .vtt.
+
+    Returns:
+    -------
+    str
+        The path the captions were written to.
+    """
+    cues = group_words_into_cues(words)
+    extension = os.path.splitext(captions_path)[1].lower()
+    if extension == '.srt':
+        content = format_srt(cues)
+    elif extension == '.vtt':
+        content = format_webvtt(cues)
+    else:
+        raise ValueError(f"Unsupported caption format: {extension}. Use .srt or .vtt.")
+    with open(captions_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return captions_path
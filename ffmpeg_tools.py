@@ -0,0 +1,216 @@
+# Standard library imports
+import os
+import tempfile
+import subprocess
+
+# Third-party imports
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+
+def run_ffmpeg(args):
+    """
+    Runs ffmpeg (the same binary MoviePy uses) with the given arguments.
+
+    Parameters:
+    ----------
+    args : list
+        Arguments to pass after the binary, e.g. ['-i', 'in.mp4', 'out.mp4'].
+
+    Raises:
+    ------
+    RuntimeError
+        If ffmpeg exits with a non-zero status; the message includes its stderr.
+    """
+    result = subprocess.run([FFMPEG_BINARY, '-y', '-hide_banner', '-loglevel', 'error', *args],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode('utf-8', errors='replace').strip()}")
+
+
+def probe_media(path):
+    """
+    Returns basic information about a media file without decoding it.
+
+    Returns:
+    -------
+    dict
+        MoviePy's parsed ffmpeg info, including 'duration', 'audio_found' and 'video_found'.
+    """
+    return ffmpeg_parse_infos(path)
+
+
+def decode_audio(path, sample_rate=16000, channels=1, start=0.0, duration=None):
+    """
+    Decodes the audio of a media file into a float32 array.
+
+    Parameters:
+    ----------
+    path : str
+        Path to an audio or video file.
+    sample_rate : int, optional
+        Output sample rate in Hz (default is 16000).
+    channels : int, optional
+        Number of output channels (default is 1).
+    start : float, optional
+        Offset in seconds to start decoding from (default is 0).
+    duration : float, optional
+        Maximum number of seconds to decode. If None, decodes to the end.
+
+    Returns:
+    -------
+    numpy.ndarray
+        Samples in [-1, 1], shaped (n_samples,) for mono or (n_samples, channels).
+    """
+    cmd = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-ss', str(start), '-i', path]
+    if duration is not None:
+        cmd += ['-t', str(duration)]
+    cmd += ['-vn', '-f', 'f32le', '-acodec', 'pcm_f32le', '-ac', str(channels), '-ar', str(sample_rate), 'pipe:1']
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode('utf-8', errors='replace').strip()}")
+    samples = np.frombuffer(result.stdout, dtype=np.float32)
+    if channels > 1:
+        samples = samples.reshape(-1, channels)
+    return samples
+
+
+def open_pcm_stream(path, sample_rate=44100, channels=2):
+    """
+    Starts decoding the audio of a media file to interleaved float32 PCM on a pipe.
+
+    Read it with `read_pcm_window` to consume the audio a window at a time; nothing
+    beyond the pipe buffer is held in memory. ffmpeg's stderr goes to a temporary
+    file (so it can never block on a full pipe) and is reported if decoding fails.
+
+    Returns:
+    -------
+    subprocess.Popen
+        The running ffmpeg process. The caller must close it with `close_pcm_stream`.
+    """
+    cmd = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-i', path,
+           '-vn', '-f', 'f32le', '-acodec', 'pcm_f32le', '-ac', str(channels), '-ar', str(sample_rate), 'pipe:1']
+    log = tempfile.TemporaryFile()
+    try:
+        stream = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=log)
+    except BaseException:
+        log.close()
+        raise
+    stream.log = log
+    return stream
+
+
+def read_pcm_window(stream, num_samples, channels=2):
+    """
+    Reads up to `num_samples` frames from a stream opened with `open_pcm_stream`.
+
+    Returns:
+    -------
+    numpy.ndarray
+        A (num_samples, channels) float32 array, zero-padded once the stream ends.
+
+    Raises:
+    ------
+    RuntimeError
+        If the stream ended because ffmpeg failed rather than because the audio did.
+    """
+    window = np.zeros((num_samples, channels), dtype=np.float32)
+    if stream is None:
+        return window
+    data = stream.stdout.read(num_samples * channels * 4)
+    if len(data) < num_samples * channels * 4 and stream.wait() != 0:
+        stream.log.seek(0)
+        raise RuntimeError(f"ffmpeg failed to decode audio: {stream.log.read().decode('utf-8', errors='replace').strip()}")
+    samples = np.frombuffer(data[:len(data) - len(data) % (channels * 4)], dtype=np.float32).reshape(-1, channels)
+    window[:len(samples)] = samples
+    return window
+
+
+def close_pcm_stream(stream):
+    """
+    Stops a stream opened with `open_pcm_stream` and releases its pipe and log.
+
+    A decoder that is still running (because the caller needed less audio than
+    the file holds) is killed; that is not an error.
+    """
+    stream.stdout.close()
+    if stream.poll() is None:
+        stream.kill()
+    stream.wait()
+    stream.log.close()
+
+
+def encode_audio(samples, sample_rate, output_format='mp3', bitrate='64k'):
+    """
+    Compresses a float32 sample array in memory by piping it through ffmpeg.
+
+    Parameters:
+    ----------
+    samples : numpy.ndarray
+        Samples in [-1, 1], shaped (n_samples,) for mono or (n_samples, channels).
+    sample_rate : int
+        Sample rate of `samples` in Hz.
+    output_format : str, optional
+        ffmpeg output format (default is 'mp3').
+    bitrate : str, optional
+        Audio bitrate (default is '64k').
+
+    Returns:
+    -------
+    bytes
+        The encoded audio file.
+    """
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    cmd = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error',
+           '-f', 'f32le', '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0',
+           '-b:a', bitrate, '-f', output_format, 'pipe:1']
+    result = subprocess.run(cmd, input=np.ascontiguousarray(samples, dtype=np.float32).tobytes(),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode('utf-8', errors='replace').strip()}")
+    return result.stdout
+
+
+def mux_audio_samples(video_path, samples, sample_rate, duration=None, bitrate='64k'):
+    """
+    Puts a float32 sample array onto a video as its only audio track, copying the video stream.
+
+    Parameters:
+    ----------
+    video_path : str
+        Path to the video whose picture is used; it must be MP4-compatible (e.g. a proxy).
+    samples : numpy.ndarray
+        Samples in [-1, 1], shaped (n_samples,) for mono or (n_samples, channels).
+    sample_rate : int
+        Sample rate of `samples` in Hz.
+    duration : float, optional
+        Only use this many seconds from the start of the video.
+    bitrate : str, optional
+        AAC bitrate (default is '64k').
+
+    Returns:
+    -------
+    bytes
+        The resulting MP4 file.
+    """
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    # The MP4 muxer needs a seekable output, so write to a file rather than a pipe
+    fd, output_path = tempfile.mkstemp(suffix='.mp4')
+    os.close(fd)
+    try:
+        cmd = [FFMPEG_BINARY, '-y', '-hide_banner', '-loglevel', 'error']
+        if duration is not None:
+            cmd += ['-t', str(duration)]
+        cmd += ['-i', video_path,
+                '-f', 'f32le', '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0',
+                '-map', '0:v:0', '-map', '1:a:0', '-c:v', 'copy', '-c:a', 'aac', '-b:a', bitrate,
+                '-shortest', '-movflags', '+faststart', output_path]
+        result = subprocess.run(cmd, input=np.ascontiguousarray(samples, dtype=np.float32).tobytes(),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        with open(output_path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(output_path)
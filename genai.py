@@ -3,12 +3,78 @@ import os
 import base64
 import time
 import tempfile
+import hashlib
+import io
+import shutil
+import threading
+from collections import deque
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Third-party imports
 import openai
 import PyPDF2
 from docx import Document
 from moviepy import VideoFileClip
+from PIL import Image
+
+
+def _extract_pdf_pages(file_path, start, stop):
+    """
+    Extracts the text of pages [start, stop) from a PDF file.
+
+    Kept at module level so it can be pickled and run in a worker process.
+    Each worker opens its own reader, so no parser state is shared.
+    """
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [(reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+# Worker processes for full-document PDF extraction, shared by all calls in this process
+PDF_WORKERS = min(4, os.cpu_count() or 1)
+_pdf_executor = None
+_pdf_executor_lock = threading.Lock()
+
+
+def _get_pdf_executor():
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            # spawn rather than fork: forking a multithreaded server (e.g. Streamlit) can deadlock the child
+            _pdf_executor = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=get_context("spawn"))
+        return _pdf_executor
+
+
+def _discard_pdf_executor(executor):
+    # A worker died (e.g. killed for memory); start a fresh pool on the next call
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is executor:
+            _pdf_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file, read in fixed-size chunks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def estimate_tokens(text):
+    """
+    Roughly estimates the number of tokens in a piece of English text.
+
+    Uses the common ~4 characters per token rule of thumb, which is close enough
+    for budgeting prompt size without pulling in a tokenizer dependency.
+    """
+    return (len(text) + 3) // 4
 
 
 class GenAI:
@@ -32,8 +98,10 @@ class GenAI:
         """
         self.client = openai.Client(api_key=openai_api_key)
         self.openai_api_key = openai_api_key
+        # Reference text already extracted, keyed by (file hash, token budget)
+        self._document_cache = {}
 
-    def generate_text(self, prompt, instructions='You are a helpful AI named Jarvis', model="gpt-4o-mini", output_type='text', temperature =1):
+    def generate_text(self, prompt, instructions='You are a helpful AI named Jarvis', model="gpt-4o-mini", output_type='text', temperature =1, n=1):
         """
         Generates a text completion using the OpenAI API.
 
@@ -54,10 +122,14 @@ class GenAI:
         output_type : str, optional (default='text')
             The format of the output. Typically 'text', but can be customized for models that support different response formats.
 
+        n : int, optional (default=1)
+            Number of alternative responses to generate in the same request.
+
         Returns:
         -------
-        str
-            The AI-generated response as a string based on the provided prompt and instructions.
+        str or list
+            The AI-generated response as a string based on the provided prompt and instructions,
+            or a list of `n` responses if `n` > 1.
 
         Example:
         -------
@@ -69,15 +141,19 @@ class GenAI:
             model=model,
             temperature=temperature,
             response_format={"type": output_type},
+            n=n,
             messages=[
                 {"role": "system", "content": instructions},
                 {"role": "user", "content": prompt}
             ]
         )
-        response = completion.choices[0].message.content
-        response = response.replace("```html", "")
-        response = response.replace("```", "")
-        return response
+        responses = []
+        for choice in completion.choices:
+            response = choice.message.content
+            response = response.replace("```html", "")
+            response = response.replace("```", "")
+            responses.append(response)
+        return responses[0] if n == 1 else responses
 
 
     def generate_chat_response(self,    
@@ -170,7 +246,7 @@ class GenAI:
 
     
 
-    def encode_image(self,image_path):
+    def encode_image(self,image_path, size=None, jpeg_quality=None):
         """
         Encodes an image file into a base64 string.
 
@@ -178,16 +254,30 @@ class GenAI:
         ----------
         image_path : str
             The path to the image file.
+        size : tuple, optional
+            (width, height) to resize the image to before encoding. If neither `size`
+            nor `jpeg_quality` is given, the file is encoded as-is.
+        jpeg_quality : int, optional
+            JPEG quality (1-95) to re-encode the image with.
 
         Returns:
         -------
         str
             Base64-encoded image string.
         """
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
-
-    def generate_image_description(self, image_paths, instructions, model = 'gpt-4o-mini'):
+        if size is None and jpeg_quality is None:
+            with open(image_path, "rb") as image_file:
+                return base64.b64encode(image_file.read()).decode('utf-8')
+
+        with Image.open(image_path) as image:
+            image = image.convert("RGB")
+            if size is not None and tuple(size) != image.size:
+                image = image.resize(tuple(size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=jpeg_quality or 85)
+        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+    def generate_image_description(self, image_paths, instructions, model = 'gpt-4o-mini', plan=None, budgeter=None, n=1):
         """
         Generates a description for one or more images using OpenAI's vision capabilities.
 
@@ -199,44 +289,71 @@ class GenAI:
             Instructions for the description.
         model : str, optional
             The OpenAI model to use (default is 'gpt-4o-mini').
+        plan : dict, optional
+            An encoding plan from `VisionBudgeter.plan` giving the image 'size',
+            'detail', 'jpeg_quality' and 'max_tokens'. If None, images are sent
+            at full size with default detail.
+        budgeter : VisionBudgeter, optional
+            If given along with `plan`, the actual token usage and latency of the
+            request are recorded on it to calibrate future estimates.
+        n : int, optional
+            Number of alternative descriptions to generate from the same request
+            (default is 1). The images are only encoded and sent once.
 
         Returns:
         -------
-        str
-            A textual description of the image(s).
+        str or list
+            A textual description of the image(s), or a list of `n` descriptions if `n` > 1.
         """
         if isinstance(image_paths, str):
             image_paths = [image_paths]
 
-        image_urls = [f"data:image/jpeg;base64,{self.encode_image(image_path)}" for image_path in image_paths]
+        if plan is None:
+            image_urls = [f"data:image/jpeg;base64,{self.encode_image(image_path)}" for image_path in image_paths]
+            image_options = {}
+            max_tokens = 1000
+        else:
+            image_urls = [f"data:image/jpeg;base64,{self.encode_image(image_path, plan['size'], plan['jpeg_quality'])}"
+                          for image_path in image_paths]
+            image_options = {"detail": plan['detail']}
+            max_tokens = plan['max_tokens']
 
         PROMPT_MESSAGES = [
             {
                 "role": "user",
                 "content": [{"type": "text", "text": instructions},
-                            *map(lambda x: {"type": "image_url", "image_url": {"url": x}}, image_urls),
+                            *map(lambda x: {"type": "image_url", "image_url": {"url": x, **image_options}}, image_urls),
                             ],
             },
         ]
         params = {
             "model": model,
             "messages": PROMPT_MESSAGES,
-            "max_tokens": 1000,
+            "max_tokens": max_tokens,
+            "n": n,
         }
 
+        start_time = time.time()
         completion = self.client.chat.completions.create(**params)
-        response = completion.choices[0].message.content
-        response = response.replace("```html", "")
-        response = response.replace("```", "")
-        return response
+        if plan is not None and budgeter is not None:
+            budgeter.record(plan, completion.usage, time.time() - start_time)
+        responses = []
+        for choice in completion.choices:
+            response = choice.message.content
+            response = response.replace("```html", "")
+            response = response.replace("```", "")
+            responses.append(response)
+        return responses[0] if n == 1 else responses
     
-    def generate_video_description(self, video_path, instructions, model='gpt-4o-mini'):
+    def generate_video_description(self, video_path, instructions, model='gpt-4o-mini', budgeter=None, n=1,
+                                   artifact_store=None):
         """
         Generates a description for a video by sampling frames and analyzing them.
         
-        This method extracts 10 frames uniformly distributed throughout the video,
-        saves them to a temporary folder, and then uses the generate_image_description
-        method to analyze these frames collectively.
+        This method extracts frames uniformly distributed throughout the video (10 by
+        default, or as many as the budgeter's plan allows), saves them to a temporary
+        folder, and then uses the generate_image_description method to analyze these
+        frames collectively.
         
         Parameters:
         ----------
@@ -246,44 +363,189 @@ class GenAI:
             Instructions for generating the description.
         model : str, optional
             The OpenAI model to use (default is 'gpt-4o-mini').
+        budgeter : VisionBudgeter, optional
+            If given, chooses the number of frames and how they are encoded to stay
+            within its token/latency ceiling, and is calibrated with the result.
+        n : int, optional
+            Number of alternative descriptions to generate from the same frames (default is 1).
+        artifact_store : ArtifactStore, optional
+            If given, sampled frames are looked up in and saved to the store, keyed by
+            the video's content hash and the frame timestamp, instead of being
+            re-extracted for every request. The frames are held (see
+            ArtifactStore.acquire) until the request completes.
             
         Returns:
         -------
-        str
-            A textual description of the video based on the sampled frames.
+        str or list
+            A textual description of the video based on the sampled frames, or a list
+            of `n` descriptions if `n` > 1.
         """
 
         
         # Create a temporary directory to store the frames
         temp_dir = tempfile.mkdtemp()
-        image_paths = []
+        frame_keys = []
         
         try:
             # Load the video
             video = VideoFileClip(video_path)
             duration = video.duration
             
-            # Calculate timestamps for 10 evenly distributed frames
-            timestamps = [i * duration / 9 for i in range(10)]  # 10 frames (0 to 9)
+            plan = None
+            num_frames = 10
+            if budgeter is not None:
+                plan = budgeter.plan(video.size, instructions, n=n)
+                num_frames = plan['frames']
+                print(f"\tVision plan: {num_frames} frames at {plan['size'][0]}x{plan['size'][1]}, "
+                      f"detail={plan['detail']}, ~{plan['estimated_input_tokens']} input tokens")
+            
+            # Calculate timestamps for evenly distributed frames (first to last)
+            timestamps = [i * duration / max(num_frames - 1, 1) for i in range(num_frames)]
             
             # Extract and save frames at each timestamp
-            for i, timestamp in enumerate(timestamps):
-                frame_path = os.path.join(temp_dir, f"frame_{i:03d}.jpg")
-                video.save_frame(frame_path, t=timestamp)
-                image_paths.append(frame_path)
+            image_paths = self._sample_frames(video, video_path, timestamps, temp_dir, artifact_store, frame_keys)
             
             # Close the video to release resources
             video.close()
             
             # Generate description from the sampled frames
-            description = self.generate_image_description(image_paths, instructions, model)
+            description = self.generate_image_description(image_paths, instructions, model, plan, budgeter, n=n)
             
             return description
             
         finally:
-            # Clean up temporary files
-            import shutil
+            # Clean up temporary files and let the store evict the frames again
             shutil.rmtree(temp_dir)
+            for key in frame_keys:
+                artifact_store.release(key)
+
+    def _sample_frames(self, video, video_path, timestamps, temp_dir, artifact_store=None, frame_keys=None):
+        """
+        Saves the frames of an open VideoFileClip at the given timestamps as JPEGs.
+
+        With an artifact store, frames are looked up by the video's content hash and
+        timestamp first, and newly extracted frames are saved to it. Either way a
+        reference is taken on each stored frame and its key appended to `frame_keys`;
+        the caller releases them once the frames have been sent.
+
+        Returns:
+        -------
+        list
+            Paths to the frames, in the order of `timestamps`.
+        """
+        image_paths = []
+        video_hash = artifact_store.hash_file(video_path) if artifact_store is not None else None
+        for timestamp in timestamps:
+            frame_key = None
+            if artifact_store is not None:
+                frame_key = artifact_store.derive_key('frame', video_hash, round(timestamp, 3))
+                stored_path = artifact_store.get(frame_key, acquire=True)
+                if stored_path is not None:
+                    frame_keys.append(frame_key)
+                    image_paths.append(stored_path)
+                    continue
+            frame_path = os.path.join(temp_dir, f"frame_{timestamp:010.3f}.jpg")
+            video.save_frame(frame_path, t=timestamp)
+            if frame_key is not None:
+                frame_path = artifact_store.put_file(frame_path, 'frame', key=frame_key, move=True, acquire=True)
+                frame_keys.append(frame_key)
+            image_paths.append(frame_path)
+        return image_paths
+
+    def generate_long_video_description(self, video_path, window_instructions, final_instructions, model='gpt-4o-mini',
+                                        window_seconds=120, frames_per_window=4, max_workers=4, max_windows=None,
+                                        budgeter=None, n=1, artifact_store=None):
+        """
+        Generates a description for a long video by summarizing it window by window.
+
+        The timeline is split into windows of at least `window_seconds`. In the map
+        step each window is described from its own small set of frames, with the
+        windows processed concurrently, each worker opening its own reader on the
+        video. In the reduce step the timestamped window summaries are composed into
+        the final description with a text-only request.
+
+        The number of windows is capped at `max_windows` (by default twice
+        `max_workers`), with windows lengthened to cover longer videos, so the map
+        step is never more than a few rounds of requests deep and the reduce prompt
+        stays bounded. Latency therefore levels off once a video is long enough to
+        reach the cap, at the cost of sampling very long videos more sparsely.
+
+        Parameters:
+        ----------
+        video_path : str
+            Path to the video file to be analyzed.
+        window_instructions : str
+            Instructions for describing the frames of one window.
+        final_instructions : str
+            Instructions for composing the final description from the window summaries.
+        model : str, optional
+            The OpenAI model to use (default is 'gpt-4o-mini').
+        window_seconds : float, optional
+            Shortest window in seconds (default is 120).
+        frames_per_window : int, optional
+            Most frames to sample per window (default is 4).
+        max_workers : int, optional
+            Number of windows analyzed at once (default is 4).
+        max_windows : int, optional
+            Most windows to split the video into (default is 2 * max_workers).
+        budgeter : VisionBudgeter, optional
+            If given, chooses how each window's frames are encoded (and may send fewer
+            than `frames_per_window`), and is calibrated with every window request.
+        n : int, optional
+            Number of alternative final descriptions to generate (default is 1).
+        artifact_store : ArtifactStore, optional
+            If given, sampled frames are cached in it (see generate_video_description).
+
+        Returns:
+        -------
+        str or list
+            The final description, or a list of `n` descriptions if `n` > 1.
+        """
+        video = VideoFileClip(video_path)
+        duration = video.duration
+        size = video.size
+        video.close()
+
+        max_windows = max_windows or 2 * max_workers
+        num_windows = max(1, min(max_windows, int(-(-duration // window_seconds))))  # ceiling division
+        window_length = duration / num_windows
+        print(f"\tLong video mode: {num_windows} windows of {window_length:.0f} seconds")
+
+        def format_time(seconds):
+            return f"{int(seconds // 60)}:{int(seconds % 60):02d}"
+
+        def describe_window(index):
+            start = index * window_length
+            end = start + window_length
+            prompt = (f"{window_instructions}\nThese frames are from {format_time(start)} to {format_time(end)} "
+                      "of the video, in chronological order.")
+            # Plan for the frames actually sent, so the budgeter is calibrated against the right estimate
+            plan = budgeter.plan(size, prompt, max_frames=frames_per_window) if budgeter is not None else None
+            num_frames = plan['frames'] if plan is not None else frames_per_window
+            # Frames at the centers of equal slices of the window
+            timestamps = [start + (i + 0.5) * window_length / num_frames for i in range(num_frames)]
+
+            temp_dir = tempfile.mkdtemp()
+            frame_keys = []
+            try:
+                window_video = VideoFileClip(video_path)
+                try:
+                    image_paths = self._sample_frames(window_video, video_path, timestamps, temp_dir, artifact_store,
+                                                      frame_keys)
+                finally:
+                    window_video.close()
+                summary = self.generate_image_description(image_paths, prompt, model, plan, budgeter)
+            finally:
+                shutil.rmtree(temp_dir)
+                for key in frame_keys:
+                    artifact_store.release(key)
+            return f"[{format_time(start)}-{format_time(end)}] {summary.strip()}"
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, num_windows))) as executor:
+            summaries = list(executor.map(describe_window, range(num_windows)))
+
+        prompt = "Timestamped summaries of consecutive segments of the video:\n\n" + "\n\n".join(summaries)
+        return self.generate_text(prompt, instructions=final_instructions, model=model, n=n)
 
     def generate_audio(self, text, file_path, model='gpt-4o-mini-tts', voice='nova', speed=1.0):
         """
@@ -332,28 +594,177 @@ class GenAI:
 
         return True
     
-    def read_pdf(self,file_path):
-        # Open the PDF file
+    def iter_pdf_pages(self, file_path, parallel=True, max_workers=None, pages_per_task=8):
+        """
+        Yields the text of each page of a PDF, in order, as it becomes available.
+
+        With `parallel`, page extraction is split into batches of pages and run in
+        a pool of worker processes shared by all calls. Only `max_workers` batches
+        are in flight at a time; the next batch is submitted as each one is
+        consumed, and batches not yet started are cancelled if the caller stops
+        early. Callers that only need the first few pages (e.g. to fill a small
+        token budget) should pass parallel=False and read serially.
+
+        Parameters:
+        ----------
+        file_path : str
+            Path to the PDF file.
+        parallel : bool, optional
+            Extract in worker processes (default is True).
+        max_workers : int, optional
+            Number of batches read ahead (default is PDF_WORKERS, the size of the pool).
+        pages_per_task : int, optional
+            Number of pages extracted per worker task (default is 8).
+
+        Yields:
+        ------
+        str
+            The extracted text of one page.
+        """
         with open(file_path, 'rb') as file:
-            # Initialize the PDF reader
-            reader = PyPDF2.PdfReader(file)
-            
-            # Initialize an empty string to store the text
-            text = ""
-            
-            # Iterate through each page in the PDF
-            for page in reader.pages:
-                # Extract the text from the page and add it to the text string
-                text += page.extract_text()
-            
-        return text
+            num_pages = len(PyPDF2.PdfReader(file).pages)
+
+        if not parallel or num_pages <= pages_per_task:
+            # Serially, one page at a time, so a caller that stops early extracts nothing more
+            with open(file_path, 'rb') as file:
+                reader = PyPDF2.PdfReader(file)
+                for page in reader.pages:
+                    yield page.extract_text() or ""
+            return
+
+        max_workers = max_workers or PDF_WORKERS
+        batch_starts = iter(range(0, num_pages, pages_per_task))
+        executor = _get_pdf_executor()
+        in_flight = deque()
+
+        def submit_next():
+            start = next(batch_starts, None)
+            if start is not None:
+                in_flight.append(executor.submit(_extract_pdf_pages, file_path, start,
+                                                 min(start + pages_per_task, num_pages)))
 
+        try:
+            for _ in range(max_workers):
+                submit_next()
+            while in_flight:
+                pages = in_flight.popleft().result()
+                submit_next()
+                yield from pages
+        except BrokenProcessPool:
+            _discard_pdf_executor(executor)
+            raise
+        finally:
+            for future in in_flight:
+                future.cancel()
 
+    def read_pdf(self,file_path):
+        """
+        Reads all of the text from a PDF file.
 
-    def read_docx(self,file_path):
+        Parameters:
+        ----------
+        file_path : str
+            Path to the PDF file.
+
+        Returns:
+        -------
+        str
+            The text of every page, concatenated in page order.
+        """
+        return "".join(self.iter_pdf_pages(file_path))
+
+    def iter_docx_blocks(self, file_path):
+        """
+        Yields the text of each paragraph and table row of a DOCX file.
+
+        Tables are yielded one row at a time with cells separated by " | ", after
+        the body paragraphs, so scripts laid out in two-column tables are not lost.
+
+        Parameters:
+        ----------
+        file_path : str
+            Path to the DOCX file.
+
+        Yields:
+        ------
+        str
+            The text of one paragraph or table row.
+        """
         doc = Document(file_path)
-        full_text = []
         for para in doc.paragraphs:
-            full_text.append(para.text)
-        return '\n'.join(full_text)
+            yield para.text
+        for table in doc.tables:
+            for row in table.rows:
+                yield " | ".join(cell.text.strip() for cell in row.cells)
+
+    def read_docx(self,file_path):
+        """
+        Reads all of the text from a DOCX file, including tables.
+
+        Parameters:
+        ----------
+        file_path : str
+            Path to the DOCX file.
+
+        Returns:
+        -------
+        str
+            The paragraphs and table rows of the document, one per line.
+        """
+        return '\n'.join(self.iter_docx_blocks(file_path))
 
+    def read_document(self, file_path, max_tokens=None):
+        """
+        Reads a PDF or DOCX file as plain text, optionally trimmed to a token budget.
+
+        The document is consumed as a stream, so extraction stops as soon as the
+        budget is filled; PDFs are then read serially, page by page, since a small
+        budget is usually filled by the first few pages and is not worth worker
+        processes. Results are cached by the SHA-256 of the file contents,
+        so the same brief uploaded again (under any name) is not re-extracted.
+
+        Parameters:
+        ----------
+        file_path : str
+            Path to a .pdf or .docx file.
+        max_tokens : int, optional
+            Maximum number of tokens (as estimated by `estimate_tokens`) of text to
+            return. If None, the whole document is returned.
+
+        Returns:
+        -------
+        str
+            The (possibly trimmed) text of the document.
+        """
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension == '.pdf':
+            blocks, separator = self.iter_pdf_pages(file_path, parallel=max_tokens is None), "\n"
+        elif extension == '.docx':
+            blocks, separator = self.iter_docx_blocks(file_path), "\n"
+        else:
+            raise ValueError(f"Unsupported document type: {extension}. Use a .pdf or .docx file.")
+
+        cache_key = (file_sha256(file_path), max_tokens)
+        if cache_key in self._document_cache:
+            blocks.close()
+            return self._document_cache[cache_key]
+
+        parts = []
+        used_tokens = 0
+        try:
+            for block in blocks:
+                if max_tokens is not None:
+                    block_tokens = estimate_tokens(block)
+                    if used_tokens + block_tokens > max_tokens:
+                        # Keep as much of the last block as still fits, then stop reading
+                        remaining_chars = max(0, (max_tokens - used_tokens) * 4)
+                        parts.append(block[:remaining_chars])
+                        break
+                    used_tokens += block_tokens
+                parts.append(block)
+        finally:
+            blocks.close()
+
+        text = separator.join(parts).strip()
+        self._document_cache[cache_key] = text
+        return text
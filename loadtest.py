@@ -0,0 +1,315 @@
+"""
+Load test for app.py: drives N concurrent simulated sessions through upload,
+generate text, generate audio and merge, and reports how latency, throughput,
+memory (of this process and the ffmpeg processes it starts) and disk use change
+as concurrency rises.
+
+Sessions run through Streamlit's app testing API (AppTest), one script run per
+step, in threads of a single process, as the Streamlit server runs sessions.
+The OpenAI and ElevenLabs calls, and optionally the merge and preview media,
+are replaced by local stubs with configurable latency, so no API keys are needed and results reflect
+the app and the machine rather than the providers.
+
+Example:
+    python loadtest.py --concurrency 1 2 4 8 --sessions 16 --text-latency 3 --tts-latency 1.5
+"""
+# Standard library imports
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+STEPS = ["upload", "generate_text", "generate_audio", "merge"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for the VoxOver Streamlit app.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Numbers of simultaneous sessions to test, in order (default: 1 2 4 8)")
+    parser.add_argument("--sessions", type=int, default=None,
+                        help="Sessions to run at each level (default: 2x the concurrency)")
+    parser.add_argument("--video-seconds", type=float, default=10.0, help="Length of the synthetic upload")
+    parser.add_argument("--text-latency", type=float, default=2.0, help="Stubbed video analysis latency in seconds")
+    parser.add_argument("--tts-latency", type=float, default=1.0, help="Stubbed TTS latency in seconds")
+    parser.add_argument("--merge-latency", type=float, default=2.0, help="Stubbed merge latency in seconds")
+    parser.add_argument("--real-merge", action="store_true",
+                        help="Run the real ffmpeg/MoviePy merge instead of the stub (needs a working ffmpeg)")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-step timeout in seconds")
+    return parser.parse_args()
+
+
+def process_tree_pids(root_pid):
+    """
+    Returns the pid of `root_pid` and of all its descendants, found through /proc.
+    """
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # The command name is in parentheses and may contain spaces; the parent pid follows it
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue  # exited while listing
+        children.setdefault(ppid, []).append(int(name))
+    pids, pending = [], [root_pid]
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        pending.extend(children.get(pid, []))
+    return pids
+
+
+def current_rss_bytes():
+    """
+    Returns the resident set size of this process plus all its child processes
+    (e.g. the ffmpeg encoders a real merge starts), or 0 where /proc is unavailable.
+
+    Pages shared between processes are counted once per process, so this is an
+    upper bound on the memory the tree actually uses.
+    """
+    try:
+        pids = process_tree_pids(os.getpid())
+    except OSError:
+        return 0
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, ValueError):
+            pass  # exited while sampling
+    return total
+
+
+def directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # removed while walking
+    return total
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class MemorySampler:
+    """
+    Samples the RSS of this process and its children in the background and keeps the peak.
+    """
+    def __init__(self, interval_s=0.1):
+        self.interval_s = interval_s
+        self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.peak = max(self.peak, current_rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def install_stubs(utils, args):
+    """
+    Replaces the provider-backed functions the app calls with local stubs.
+
+    The stubs still write their outputs to the artifact store, so disk growth is
+    measured the same way as in production.
+    """
+    store = utils.artifact_store
+
+    def generate_voiceover_text(video_path, instructions, reference_paths=None, n_variants=1, reference_names=None):
+        time.sleep(args.text_latency)
+        variants = [f"Take {i + 1} for {instructions}. " + "This is a stubbed voiceover sentence. " * 20
+                    for i in range(n_variants)]
+        return variants[0] if n_variants == 1 else variants
+
+    def synthesize_voiceover(text, with_captions=False, *unused, acquire=False, **unused_kwargs):
+        time.sleep(args.tts_latency)
+        key = store.derive_key('tts', text)
+        seconds = len(text.split()) * 0.3  # read at 200 words per minute
+        if args.real_merge:
+            # The real merge needs decodable audio, so synthesize a tone of the right length
+            from ffmpeg_tools import run_ffmpeg
+            audio_path = utils.cached_artifact(key, 'tts', '.mp3', lambda path: run_ffmpeg(
+                ['-f', 'lavfi', '-i', f'sine=frequency=220:duration={seconds}', '-c:a', 'libmp3lame', path]),
+                acquire=acquire)
+        else:
+            # Roughly the size of a 128 kbps MP3 of that length
+            audio_path = store.put_bytes(os.urandom(int(seconds * 16000)), 'tts', '.mp3', key=key, acquire=acquire)
+        captions_path = None
+        if with_captions:
+            captions = "1\n00:00:00,000 --> 00:00:02,000\nStubbed caption\n"
+            captions_path = store.put_bytes(captions.encode("utf-8"), 'tts-captions', '.srt',
+                                            key=store.derive_key('tts-captions', text), acquire=acquire)
+        return audio_path, captions_path
+
+    def render_voiceover_video(video_path, audio_tracks, video_volume=1.0, audio_volume=1.0, subtitle_tracks=None,
+                               acquire=False):
+        time.sleep(args.merge_latency)
+        key = store.derive_key('merged', store.hash_file(video_path), sorted(audio_tracks.values()),
+                               video_volume, audio_volume)
+        return store.put_file(video_path, 'merged', key=key, acquire=acquire)
+
+    def stub_volume_preview_tracks(video_path, audio_path):
+        import numpy as np
+        length = int(utils.VOLUME_PREVIEW_SECONDS * utils.VOLUME_PREVIEW_SAMPLE_RATE)
+        return {"original": np.zeros(length, dtype=np.float32), "voiceover": np.zeros(length, dtype=np.float32),
+                "sample_rate": utils.VOLUME_PREVIEW_SAMPLE_RATE}
+
+    utils.generate_voiceover_text = generate_voiceover_text
+    utils.synthesize_voiceover = synthesize_voiceover
+    if not args.real_merge:
+        utils.render_voiceover_video = render_voiceover_video
+        # Stub uploads are not decodable, so preview the originals rather than rendering proxies,
+        # and mix silence for the volume preview
+        utils.request_proxy_video = lambda video_path, acquire=False: ("failed", video_path)
+        utils.load_volume_preview_tracks = stub_volume_preview_tracks
+
+
+def make_synthetic_video(path, seconds, real):
+    """
+    Writes the clip that every session uploads.
+
+    A real encoded clip (test pattern and tone) is needed for the real merge; for
+    stubbed runs random bytes of a similar size are enough.
+    """
+    if real:
+        from ffmpeg_tools import run_ffmpeg
+        run_ffmpeg(['-f', 'lavfi', '-i', f'testsrc=size=1280x720:rate=30:duration={seconds}',
+                    '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                    '-c:v', 'libx264', '-preset', 'veryfast', '-c:a', 'aac', '-shortest', path])
+    else:
+        with open(path, 'wb') as f:
+            f.write(os.urandom(int(seconds * 250_000)))  # ~2 Mbps
+
+
+def run_session(session_index, video_bytes, utils, args):
+    """
+    Drives one session through the app and returns its per-step timings.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    timings = {}
+    at = AppTest.from_file("app.py", default_timeout=args.timeout)
+    at.session_state["authenticated"] = True
+
+    # Upload: AppTest cannot drive st.file_uploader, so do what the app does with the bytes
+    start = time.perf_counter()
+    data = video_bytes
+    if not args.real_merge:
+        # A session-specific suffix keeps stub uploads from deduplicating across sessions
+        data += f"session-{session_index}-{time.time_ns()}".encode("utf-8")
+    video_path = utils.artifact_store.put_bytes(data, 'video', '.mp4', acquire=True)
+    at.session_state["uploaded_video_path"] = video_path
+    at.session_state["uploaded_video_name"] = f"loadtest_{session_index}.mp4"
+    at.session_state["artifact_keys"] = [utils.artifact_store.key_for_path(video_path)]
+    at.run()
+    timings["upload"] = time.perf_counter() - start
+
+    def step(name, act):
+        start = time.perf_counter()
+        act()
+        at.run()
+        timings[name] = time.perf_counter() - start
+        if at.exception:
+            raise RuntimeError(f"{name}: {at.exception[0].message}")
+        if at.session_state["processing_error"]:
+            raise RuntimeError(f"{name}: {at.session_state['processing_error']}")
+
+    instructions = next(w for w in at.text_area if w.label.startswith("Describe"))
+    step("generate_text", lambda: (instructions.input(f"Load test session {session_index}"),
+                                   at.button(key="generate_text_button").click()))
+    step("generate_audio", lambda: at.button(key="generate_audio_button").click())
+    step("merge", lambda: at.button(key="merge_button").click())
+
+    temp_dir = at.session_state["temp_dir"]
+    timings["temp_bytes"] = directory_bytes(temp_dir)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    return timings
+
+
+def run_level(concurrency, num_sessions, video_bytes, utils, args):
+    store_root = utils.artifact_store.root
+    disk_before = directory_bytes(store_root)
+    rss_before = current_rss_bytes()
+    results, errors = [], []
+
+    def worker(session_index):
+        try:
+            results.append(run_session(session_index, video_bytes, utils, args))
+        except Exception as e:
+            errors.append(str(e))
+
+    start = time.perf_counter()
+    with MemorySampler() as memory:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(worker, range(num_sessions)))
+    elapsed = time.perf_counter() - start
+
+    print(f"\n=== concurrency {concurrency}: {len(results)}/{num_sessions} sessions ok in {elapsed:.1f}s "
+          f"({len(results) / elapsed * 60:.1f} sessions/min)")
+    print(f"{'step':<16}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}")
+    for name in STEPS:
+        values = [r[name] for r in results if name in r]
+        print(f"{name:<16}{percentile(values, 0.50):>9.2f}{percentile(values, 0.95):>9.2f}{percentile(values, 0.99):>9.2f}")
+    mib = 1024 ** 2
+    print(f"memory (this process + children): rss {rss_before / mib:.0f} -> {current_rss_bytes() / mib:.0f} MiB, "
+          f"peak {memory.peak / mib:.0f} MiB")
+    temp_bytes = sum(r["temp_bytes"] for r in results)
+    print(f"disk: artifact store +{(directory_bytes(store_root) - disk_before) / mib:.1f} MiB, "
+          f"session temp dirs {temp_bytes / mib:.1f} MiB")
+    for error in errors[:5]:
+        print(f"error: {error}")
+
+
+def main():
+    args = parse_args()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.getcwd())
+
+    # Keep load test artifacts out of the real store, and let utils import without real keys
+    work_dir = tempfile.mkdtemp(prefix="voxover_loadtest_")
+    os.environ["ARTIFACT_STORE_DIR"] = os.path.join(work_dir, "artifacts")
+    os.environ.setdefault("OPENAI_API_KEY", "loadtest")
+    os.environ.setdefault("ELEVENLABS_API_KEY", "loadtest")
+    os.environ.setdefault("ELEVENLABS_VOICE_ID", "loadtest")
+
+    import utils
+    install_stubs(utils, args)
+
+    video_path = os.path.join(work_dir, "synthetic.mp4")
+    make_synthetic_video(video_path, args.video_seconds, args.real_merge)
+    with open(video_path, 'rb') as f:
+        video_bytes = f.read()
+
+    try:
+        for concurrency in args.concurrency:
+            run_level(concurrency, args.sessions or concurrency * 2, video_bytes, utils, args)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+# Standard library imports
+import os
+
+# Third-party imports
+import pytest
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: takes minutes; only runs with RUN_SLOW_TESTS=1")
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get("RUN_SLOW_TESTS") == "1":
+        return
+    skip_slow = pytest.mark.skip(reason="slow; set RUN_SLOW_TESTS=1 to run")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
@@ -0,0 +1,106 @@
+"""
+Checks that merge_video_with_audio_streaming uses bounded memory: peak RSS for an
+hour-long video should match that of a short one.
+
+Each merge runs in a fresh interpreter so its peak RSS is not hidden by whatever
+the test process has already allocated. Generating and merging the hour-long
+clip takes a few minutes, so that test is marked slow and only runs with
+RUN_SLOW_TESTS=1 (see conftest.py).
+"""
+# Standard library imports
+import os
+import sys
+import json
+import subprocess
+
+# Third-party imports
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+pytest.importorskip("numpy")
+pytest.importorskip("moviepy")
+
+from ffmpeg_tools import run_ffmpeg  # noqa: E402
+
+SHORT_SECONDS = 60
+LONG_SECONDS = 3600
+
+# Growth allowed from the short to the long merge. Holding an hour of 44.1 kHz stereo
+# float32 audio would take ~1.2 GB, so anything that scales with the duration fails clearly.
+RSS_TOLERANCE_BYTES = 64 * 1024 ** 2
+
+# Runs one merge and prints the peak RSS of the interpreter and of its largest ffmpeg child
+MERGE_SCRIPT = """
+import sys, json, resource
+from utils import merge_video_with_audio_streaming
+merge_video_with_audio_streaming(sys.argv[1], sys.argv[2], sys.argv[3], video_volume=0.5, audio_volume=1.0)
+print(json.dumps({
+    "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+}))
+"""
+
+
+def make_video(path, seconds):
+    # A small, 1 fps picture keeps generation fast; the audio is what the merge streams
+    run_ffmpeg(['-f', 'lavfi', '-i', f'testsrc=size=160x120:rate=1:duration={seconds}',
+                '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-b:a', '32k', '-shortest', path])
+
+
+def make_voiceover(path, seconds):
+    run_ffmpeg(['-f', 'lavfi', '-i', f'sine=frequency=220:duration={seconds}', '-c:a', 'libmp3lame', '-b:a', '32k',
+                path])
+
+
+def run_python(script, args, work_dir):
+    env = dict(os.environ,
+               ARTIFACT_STORE_DIR=os.path.join(work_dir, "artifacts"),
+               OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "test"),
+               ELEVENLABS_API_KEY=os.environ.get("ELEVENLABS_API_KEY", "test"),
+               ELEVENLABS_VOICE_ID=os.environ.get("ELEVENLABS_VOICE_ID", "test"))
+    return subprocess.run([sys.executable, "-c", script, *args], cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+
+
+def run_merge(video_path, audio_path, merged_path, work_dir):
+    return run_python(MERGE_SCRIPT, [video_path, audio_path, merged_path], work_dir)
+
+
+@pytest.fixture(autouse=True)
+def require_app_dependencies(tmp_path):
+    result = run_python("import utils", [], str(tmp_path))
+    if "ModuleNotFoundError" in result.stderr:
+        pytest.skip(f"utils cannot be imported: {result.stderr.strip().splitlines()[-1]}")
+
+
+def measure_peak_rss(tmp_path, seconds):
+    video_path = str(tmp_path / f"video_{seconds}.mp4")
+    audio_path = str(tmp_path / f"voiceover_{seconds}.mp3")
+    merged_path = str(tmp_path / f"merged_{seconds}.mp4")
+    make_video(video_path, seconds)
+    make_voiceover(audio_path, seconds)
+    result = run_merge(video_path, audio_path, merged_path, str(tmp_path))
+    assert result.returncode == 0, result.stderr
+    assert os.path.getsize(merged_path) > 0
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.slow
+def test_streaming_merge_peak_rss_does_not_grow_with_duration(tmp_path):
+    short = measure_peak_rss(tmp_path, SHORT_SECONDS)
+    long = measure_peak_rss(tmp_path, LONG_SECONDS)
+    assert long["self"] - short["self"] < RSS_TOLERANCE_BYTES, (short, long)
+    assert long["children"] - short["children"] < RSS_TOLERANCE_BYTES, (short, long)
+
+
+def test_streaming_merge_raises_when_the_voiceover_cannot_be_decoded(tmp_path):
+    video_path = str(tmp_path / "video.mp4")
+    audio_path = str(tmp_path / "voiceover.mp3")
+    make_video(video_path, 5)
+    with open(audio_path, "wb") as f:
+        f.write(os.urandom(4096))
+    result = run_merge(video_path, audio_path, str(tmp_path / "merged.mp4"), str(tmp_path))
+    assert result.returncode != 0
+    assert "ffmpeg failed to decode audio" in result.stderr
@@ -1,5 +1,13 @@
 import os
-from genai import GenAI
+import base64
+import tempfile
+import threading
+from genai import GenAI, estimate_tokens
+from artifact_store import ArtifactStore
+from vision_budget import VisionBudgeter
+from captions import words_from_character_alignment, estimate_word_timings, write_captions
+from ffmpeg_tools import (FFMPEG_BINARY, run_ffmpeg, probe_media, open_pcm_stream, read_pcm_window,
+                          close_pcm_stream, decode_audio, encode_audio, mux_audio_samples)
 from moviepy import VideoFileClip
 from elevenlabs import ElevenLabs
 from elevenlabs import VoiceSettings
@@ -60,6 +68,25 @@ APP_PASSWORD = os.getenv('PASSWORD')
 
 jarvis = GenAI(OPENAI_API_KEY)
 
+# Content-addressed store for uploads, frames, audio and renders. Point ARTIFACT_STORE_DIR
+# at a directory on a local disk shared by all replicas on the host so they reuse each
+# other's work (its SQLite index is not safe on a network filesystem).
+ARTIFACT_STORE_DIR = os.getenv('ARTIFACT_STORE_DIR', os.path.join(tempfile.gettempdir(), 'voxover_artifacts'))
+ARTIFACT_STORE_MAX_BYTES = int(float(os.getenv('ARTIFACT_STORE_MAX_GB', '20')) * 1024**3)
+artifact_store = ArtifactStore(ARTIFACT_STORE_DIR, max_bytes=ARTIFACT_STORE_MAX_BYTES)
+
+# Maximum number of tokens of reference documents added to the voiceover prompt
+REFERENCE_TOKEN_BUDGET = 2000
+
+# Ceilings for the frame-analysis request; the budgeter is shared so its
+# calibration carries over between requests in this process
+VISION_MAX_INPUT_TOKENS = int(os.getenv('VISION_MAX_INPUT_TOKENS', '60000'))
+VISION_MAX_LATENCY_S = float(os.getenv('VISION_MAX_LATENCY_S', '30'))
+vision_budgeter = VisionBudgeter(model='gpt-4o-mini',
+                                 max_input_tokens=VISION_MAX_INPUT_TOKENS,
+                                 max_latency_s=VISION_MAX_LATENCY_S,
+                                 min_frames=6)
+
 #You are Seemona an influencer describiing these Bose headphones for a sponsored post in IG
 
 
@@ -80,16 +107,58 @@ def get_video_duration(video_path):
 
 
 
-def generate_voiceover_text(video_path, instructions):
+# Videos at least this long (in seconds) are analyzed window by window, see GenAI.generate_long_video_description
+LONG_VIDEO_MIN_DURATION = 5 * 60
+LONG_VIDEO_WINDOW_INSTRUCTIONS = (
+    "Describe what happens in these frames from one segment of a longer video. Be factual and compact "
+    "(under 80 words): the setting, people, products with any visible names, text or prices, and what changes "
+    "between frames. Do not write a voiceover."
+)
+
+
+def load_reference_material(reference_paths, max_tokens=REFERENCE_TOKEN_BUDGET, reference_names=None):
+    """
+    Reads product briefs or scripts (PDF/DOCX) to use as grounding for the voiceover.
+
+    The token budget is shared across all documents in order, so the first
+    document is read in full before later ones get what is left.
+
+    Args:
+        reference_paths (list): Paths to .pdf or .docx files
+        max_tokens (int): Total token budget for all reference text
+        reference_names (dict, optional): Path -> name to head each document with,
+            e.g. the uploaded file name of a document kept in the artifact store
+
+    Returns:
+        str: reference text, with each document under its own heading
+    """
+    reference_names = reference_names or {}
+    sections = []
+    remaining = max_tokens
+    for path in reference_paths:
+        if remaining <= 0:
+            break
+        text = jarvis.read_document(path, max_tokens=remaining)
+        if not text:
+            continue
+        remaining -= estimate_tokens(text)
+        sections.append(f"### {reference_names.get(path, os.path.basename(path))}\n{text}")
+    return "\n\n".join(sections)
+
+
+def generate_voiceover_text(video_path, instructions, reference_paths=None, n_variants=1, reference_names=None):
     """
     Generates an audio narration for a video based on user instructions.
     
     Args:
         video_path (str): Path to the video file
         instructions (str): User instructions for narration style/content
+        reference_paths (list, optional): PDF/DOCX briefs or scripts to ground the narration in
+        n_variants (int, optional): Number of alternative takes to generate from one vision request
+        reference_names (dict, optional): Path -> display name of each reference document
     
     Returns:
-        str: video voiceover text
+        str: video voiceover text, or a list of n_variants texts if n_variants > 1
     """
     if not OPENAI_API_KEY or OPENAI_API_KEY == "your_openai_api_key_here":
         raise ValueError("OpenAI API key is not set. Please create a .env file with your OPENAI_API_KEY.")
@@ -101,7 +170,25 @@ def generate_voiceover_text(video_path, instructions):
     print(f"\tMax words for voiceover: {nwords_max} words")
     instructions_modified = instructions + f"\nYour voiceover text should be less than {nwords_max} words long."
     instructions_modified += "Do not use any hashtags or emojis in the voiceover text as this will be read aloud."
-    voiceover_text = jarvis.generate_video_description(video_path, instructions_modified, model='gpt-4o-mini')
+    if reference_paths:
+        reference_text = load_reference_material(reference_paths, reference_names=reference_names)
+        if reference_text:
+            print(f"\tReference material: ~{estimate_tokens(reference_text)} tokens")
+            instructions_modified += ("\nUse the following reference material for facts, names and wording. "
+                                      "Only mention details that fit what is shown in the video.\n" + reference_text)
+    if duration_secs >= LONG_VIDEO_MIN_DURATION:
+        # Too long for one set of frames to cover: summarize windows in parallel, then write from the summaries
+        final_instructions = (instructions_modified + "\nYou cannot see the video itself; you are given timestamped "
+                              "summaries of its segments. Write a single voiceover for the whole video that follows "
+                              "its order of events. Reply with only the voiceover text.")
+        voiceover_text = jarvis.generate_long_video_description(video_path, LONG_VIDEO_WINDOW_INSTRUCTIONS,
+                                                                final_instructions, model='gpt-4o-mini',
+                                                                budgeter=vision_budgeter, n=n_variants,
+                                                                artifact_store=artifact_store)
+        return voiceover_text
+    voiceover_text = jarvis.generate_video_description(video_path, instructions_modified, model='gpt-4o-mini',
+                                                       budgeter=vision_budgeter, n=n_variants,
+                                                       artifact_store=artifact_store)
     return voiceover_text
 
     
@@ -109,24 +196,36 @@ def generate_voiceover_text(video_path, instructions):
 def generate_voiceover_audio(text, 
                              file_path, 
                             voice_name='nova', 
-                             speed=1.0):
+                             speed=1.0,
+                             captions_path=None):
+    """
+    Generate speech from text using OpenAI TTS.
+
+    OpenAI does not return timing data, so if captions_path is given the words are
+    aligned to the generated audio locally (see captions.estimate_word_timings).
+    """
     complete  = jarvis.generate_audio(text,
                            file_path, 
                            model='gpt-4o-mini-tts', 
                            voice=voice_name, 
                            speed=speed)
+    if captions_path is not None:
+        write_captions(estimate_word_timings(text, file_path), captions_path)
     return complete
 
 def generate_voiceover_audio_elevenlabs(text, 
                                         file_path,  
                                         model_id="eleven_multilingual_v2",    
                                         voice_id=None,
-                                        speed=1.0):
+                                        speed=1.0,
+                                        captions_path=None):
     """
     Generate speech from text using ElevenLabs, with voice cloning.
 
     Loads ELEVENLABS_API_KEY and ELEVENLABS_VOICE_ID from .env file using python-dotenv.
     If voice_id is not provided, uses ELEVENLABS_VOICE_ID from environment variables.
+    If captions_path (.srt or .vtt) is given, uses timing-enabled synthesis and writes
+    word-timed captions from the character timestamps ElevenLabs returns.
     """
     if not ELEVENLABS_API_KEY or ELEVENLABS_API_KEY == "your_elevenlabs_api_key_here":
         raise ValueError("ElevenLabs API key is not set. Please create a .env file with your ELEVENLABS_API_KEY.")
@@ -140,6 +239,25 @@ def generate_voiceover_audio_elevenlabs(text,
     client = ElevenLabs(
         api_key=ELEVENLABS_API_KEY,
     )
+    if captions_path is not None:
+        response = client.text_to_speech.convert_with_timestamps(
+            voice_id=voice_id,
+            output_format="mp3_44100_128",
+            text=text,
+            model_id=model_id,
+            voice_settings=VoiceSettings(
+                speed=speed
+            )
+        )
+        with open(file_path, 'wb') as f:
+            f.write(base64.b64decode(response.audio_base_64))
+        alignment = response.alignment
+        words = words_from_character_alignment(alignment.characters,
+                                               alignment.character_start_times_seconds,
+                                               alignment.character_end_times_seconds)
+        write_captions(words, captions_path)
+        return True
+
     audio = client.text_to_speech.convert(
             voice_id=voice_id,
             output_format="mp3_44100_128",
@@ -157,7 +275,730 @@ def generate_voiceover_audio_elevenlabs(text,
     return True
 
 
-def merge_video_with_audio(video_path, audio_path, merged_path, video_volume=1.0, audio_volume=1.0):
+def cached_artifact(key, kind, extension, produce, acquire=False):
+    """
+    Returns the path of an artifact from the store, producing and storing it first if needed.
+
+    Args:
+        key (str): Artifact key, usually from artifact_store.derive_key
+        kind (str): Artifact type label, e.g. 'tts' or 'merged'
+        extension (str): File extension including the dot
+        produce (callable): Called with a staging path to write the artifact to
+        acquire (bool): Take a reference on the artifact as it is looked up or stored,
+            so it cannot be evicted before the caller uses it; release it when done
+
+    Returns:
+        str: path of the stored artifact
+    """
+    path = artifact_store.get(key, acquire=acquire)
+    if path is not None:
+        return path
+    staging_path = artifact_store.staging_path(extension)
+    try:
+        produce(staging_path)
+        return artifact_store.put_file(staging_path, kind, key=key, move=True, acquire=acquire)
+    finally:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+
+
+def cached_text(key, kind, produce):
+    """
+    Returns the contents of a text artifact, producing it with cached_artifact if needed.
+    """
+    path = cached_artifact(key, kind, '.txt', produce, acquire=True)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    finally:
+        artifact_store.release(key)
+
+
+def synthesize_voiceover(text, with_captions=False, model_id="eleven_multilingual_v2", voice_id=None, speed=1.0,
+                         acquire=False):
+    """
+    Synthesizes a voiceover with ElevenLabs, reusing a stored result for identical input.
+
+    Args:
+        text (str): Voiceover script
+        with_captions (bool): Also produce word-timed SRT captions
+        model_id (str): ElevenLabs model
+        voice_id (str, optional): ElevenLabs voice, defaults to ELEVENLABS_VOICE_ID
+        speed (float): Speech speed multiplier
+        acquire (bool): Take a reference on each returned artifact (see cached_artifact)
+
+    Returns:
+        tuple: (audio_path, captions_path), captions_path is None without captions
+    """
+    voice_id = voice_id or ELEVENLABS_VOICE_ID
+    inputs = (text, model_id, voice_id, speed)
+    audio_key = artifact_store.derive_key('tts', *inputs)
+    captions_key = artifact_store.derive_key('tts-captions', *inputs)
+
+    if not with_captions:
+        audio_path = cached_artifact(audio_key, 'tts', '.mp3',
+                                     lambda path: generate_voiceover_audio_elevenlabs(text, path, model_id, voice_id, speed),
+                                     acquire=acquire)
+        return audio_path, None
+
+    audio_path = artifact_store.get(audio_key, acquire=acquire)
+    captions_path = artifact_store.get(captions_key, acquire=acquire)
+    if audio_path is not None and captions_path is not None:
+        return audio_path, captions_path
+
+    # Both are produced again below, which takes new references
+    if acquire:
+        for key, path in ((audio_key, audio_path), (captions_key, captions_path)):
+            if path is not None:
+                artifact_store.release(key)
+
+    # Timing-enabled synthesis produces both files in one request
+    staging_audio = artifact_store.staging_path('.mp3')
+    staging_captions = artifact_store.staging_path('.srt')
+    try:
+        generate_voiceover_audio_elevenlabs(text, staging_audio, model_id, voice_id, speed, captions_path=staging_captions)
+        audio_path = artifact_store.put_file(staging_audio, 'tts', key=audio_key, move=True, acquire=acquire)
+        captions_path = artifact_store.put_file(staging_captions, 'tts-captions', key=captions_key, move=True,
+                                                acquire=acquire)
+    finally:
+        for staging_path in (staging_audio, staging_captions):
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+    return audio_path, captions_path
+
+
+SCENE_DESCRIPTION_INSTRUCTIONS = (
+    "Describe this video for a scriptwriter who cannot see it. The frames are in chronological order. "
+    "In under 250 words, list the setting, people, products (with any visible names, text or prices) "
+    "and the sequence of key moments. Be factual and compact; do not write a voiceover."
+)
+
+
+
+def describe_video_scenes(video_path):
+    """
+    Returns a compact text description of a video's content, analyzing its frames only once.
+
+    The description is stored in the artifact store under the hash of the video
+    file, so every later refinement of the script for the same video (on any
+    replica) is a text-only request.
+
+    Args:
+        video_path (str): Path to the video file
+
+    Returns:
+        str: scene description
+    """
+    def describe(path):
+        if get_video_duration(video_path) >= LONG_VIDEO_MIN_DURATION:
+            description = jarvis.generate_long_video_description(
+                video_path, LONG_VIDEO_WINDOW_INSTRUCTIONS,
+                SCENE_DESCRIPTION_INSTRUCTIONS + " You are given timestamped summaries of its segments instead of frames.",
+                model='gpt-4o-mini', budgeter=vision_budgeter, artifact_store=artifact_store)
+        else:
+            description = jarvis.generate_video_description(
+                video_path, SCENE_DESCRIPTION_INSTRUCTIONS, model='gpt-4o-mini', budgeter=vision_budgeter,
+                artifact_store=artifact_store)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(description)
+
+    key = artifact_store.derive_key('scene', artifact_store.hash_file(video_path), SCENE_DESCRIPTION_INSTRUCTIONS)
+    return cached_text(key, 'scene', describe)
+
+
+def refine_voiceover_text(video_path, chat_history, feedback):
+    """
+    Revises the voiceover script according to the user's feedback, without resending frames.
+
+    The model sees the cached scene description (see describe_video_scenes) and the
+    conversation so far, in which the assistant turns are the previous versions of
+    the script. The feedback and the reply are appended to chat_history in place
+    once the request succeeds.
+
+    Args:
+        video_path (str): Path to the video file
+        chat_history (list): Previous messages, each a dict with "role" and "content";
+            should start with the current script as an assistant message
+        feedback (str): The requested change, e.g. "shorter" or "mention the price"
+
+    Returns:
+        str: revised voiceover text
+    """
+    if not OPENAI_API_KEY or OPENAI_API_KEY == "your_openai_api_key_here":
+        raise ValueError("OpenAI API key is not set. Please create a .env file with your OPENAI_API_KEY.")
+
+    wps = 200/60 #200 words per minute/ 60 seconds
+    nwords_max = wps*get_video_duration(video_path)
+    scene_description = describe_video_scenes(video_path)
+    instructions = (
+        "You are revising the voiceover script for a video. Here is a description of the video:\n"
+        f"{scene_description}\n\n"
+        "Apply the user's latest request to the most recent version of the script and reply with "
+        "only the full revised script, nothing else. "
+        f"The script should be less than {nwords_max:.0f} words long. "
+        "Do not use any hashtags or emojis as this will be read aloud."
+    )
+    user_turn = {"role": "user", "content": feedback}
+    revised_text = jarvis.generate_chat_response(chat_history + [user_turn], instructions, model='gpt-4o-mini')
+    # Only record the exchange once it succeeded, so a failed call can simply be retried
+    chat_history.extend([user_turn, {"role": "assistant", "content": revised_text}])
+    return revised_text
+
+
+def generate_variant_previews(texts, preview_words=40, max_workers=4, acquire=False):
+    """
+    Synthesizes a short audio preview of each voiceover variant concurrently.
+
+    Only the first `preview_words` words of each text are synthesized, which is
+    enough to judge tone and pacing while keeping each TTS call short.
+
+    Args:
+        texts (list): Voiceover variants
+        preview_words (int): Number of words to synthesize per variant
+        max_workers (int): Maximum number of concurrent TTS requests
+        acquire (bool): Take a reference on each preview (see cached_artifact)
+
+    Returns:
+        list: Path to each variant's preview, or None where synthesis failed
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def synthesize(index):
+        words = texts[index].split()
+        preview_text = " ".join(words[:preview_words])
+        if len(words) > preview_words:
+            preview_text += "..."
+        try:
+            preview_path, _ = synthesize_voiceover(preview_text, acquire=acquire)
+            return preview_path
+        except Exception as e:
+            print(f"Error generating preview for variant {index + 1}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(texts)))) as executor:
+        return list(executor.map(synthesize, range(len(texts))))
+
+
+# ISO 639-2 codes used to tag audio and subtitle tracks, by language name
+LANGUAGE_CODES = {
+    'English': 'eng',
+    'Spanish': 'spa',
+    'French': 'fra',
+    'German': 'deu',
+    'Italian': 'ita',
+    'Portuguese': 'por',
+    'Dutch': 'nld',
+    'Polish': 'pol',
+    'Swedish': 'swe',
+    'Turkish': 'tur',
+    'Russian': 'rus',
+    'Arabic': 'ara',
+    'Hindi': 'hin',
+    'Japanese': 'jpn',
+    'Korean': 'kor',
+    'Chinese': 'zho',
+}
+
+
+def language_code(language):
+    """
+    Returns the ISO 639-2 code for a language name, for tagging audio and subtitle tracks.
+    """
+    return LANGUAGE_CODES.get(language, language[:3].lower())
+
+
+def translate_voiceover_text(text, language):
+    """
+    Translates a voiceover script into another language, keeping it speakable.
+
+    Args:
+        text (str): Voiceover script
+        language (str): Target language name, e.g. "Spanish"
+
+    Returns:
+        str: translated script
+    """
+    instructions = (f"You translate voiceover scripts into {language}. Keep the meaning, tone and approximate "
+                    "length so the narration still fits the video. Reply with only the translated script, "
+                    "with no hashtags or emojis as it will be read aloud.")
+
+    def translate(path):
+        translated = jarvis.generate_text(text, instructions=instructions, model="gpt-4o-mini").strip()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(translated)
+
+    key = artifact_store.derive_key('translation', text, language, instructions)
+    return cached_text(key, 'translation', translate)
+
+
+def generate_multilingual_voiceovers(text, languages, source_language="English", with_captions=False, max_workers=6,
+                                     acquire=False):
+    """
+    Translates a script into several languages and synthesizes each one, all concurrently.
+
+    Each language is translated and then synthesized in its own worker, so a slow
+    translation only delays its own language.
+
+    Args:
+        text (str): Voiceover script in source_language
+        languages (list): Language names to produce, e.g. ["Spanish", "French"]
+        source_language (str): Language of text; it is synthesized without translation
+        with_captions (bool): Also write an SRT file per language
+        max_workers (int): Maximum number of languages processed at once
+        acquire (bool): Take a reference on each audio and caption file (see cached_artifact)
+
+    Returns:
+        dict: language -> {"text", "audio_path", "captions_path"}, in the order of languages
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def process(language):
+        translated = text if language == source_language else translate_voiceover_text(text, language)
+        audio_path, captions_path = synthesize_voiceover(translated, with_captions, acquire=acquire)
+        return {"text": translated, "audio_path": audio_path, "captions_path": captions_path}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(languages)))) as executor:
+        results = list(executor.map(process, languages))
+    return dict(zip(languages, results))
+
+
+def merge_video_with_audio_tracks(video_path, audio_tracks, merged_path, video_volume=1.0, audio_volume=1.0,
+                                  subtitle_tracks=None):
+    """
+    Writes one video with a separate, language-tagged audio track per voiceover.
+
+    Each track is the original video audio mixed with one language's voiceover. All
+    tracks are produced by a single ffmpeg run, and the video stream is copied rather
+    than re-encoded; if the source codec cannot be copied into MP4 it is encoded once
+    with libx264 and shared by every track.
+
+    Parameters:
+    ----------
+    video_path : str
+        Path to the input video file.
+    audio_tracks : dict
+        Language name -> voiceover audio path. The first entry is the default track.
+    merged_path : str
+        Path where the merged MP4 will be saved.
+    video_volume : float, optional
+        Volume level for the original video audio (default is 1.0).
+    audio_volume : float, optional
+        Volume level for the voiceover tracks (default is 1.0).
+    subtitle_tracks : dict, optional
+        Language name -> .srt/.vtt path, added as tagged soft subtitle tracks.
+
+    Returns:
+    -------
+    str
+        Path to the merged video file.
+    """
+    info = probe_media(video_path)
+    duration = info['duration']
+    has_original_audio = info.get('audio_found', False)
+    languages = list(audio_tracks)
+    subtitle_tracks = subtitle_tracks or {}
+    subtitle_languages = [language for language in languages if subtitle_tracks.get(language)]
+
+    inputs = ['-i', video_path]
+    for language in languages:
+        inputs += ['-i', audio_tracks[language]]
+    for language in subtitle_languages:
+        inputs += ['-i', subtitle_tracks[language]]
+
+    # Split the original audio once per language and mix each copy with one voiceover
+    filters = []
+    if has_original_audio:
+        split_labels = "".join(f"[orig{i}]" for i in range(len(languages)))
+        filters.append(f"[0:a:0]asplit={len(languages)}{split_labels}")
+    for i in range(len(languages)):
+        voiceover = f"[{i + 1}:a:0]volume={audio_volume}"
+        if has_original_audio:
+            filters.append(f"{voiceover}[vo{i}]")
+            filters.append(f"[orig{i}]volume={video_volume}[ov{i}]")
+            filters.append(f"[ov{i}][vo{i}]amix=inputs=2:duration=longest:normalize=0,apad[a{i}]")
+        else:
+            filters.append(f"{voiceover},apad[a{i}]")
+
+    output_options = ['-filter_complex', ";".join(filters), '-map', '0:v:0']
+    for i, language in enumerate(languages):
+        code = language_code(language)
+        output_options += ['-map', f'[a{i}]',
+                           f'-metadata:s:a:{i}', f'language={code}',
+                           f'-metadata:s:a:{i}', f'title={language}',
+                           f'-disposition:a:{i}', 'default' if i == 0 else '0']
+    for i, language in enumerate(subtitle_languages):
+        code = language_code(language)
+        output_options += ['-map', f'{len(languages) + 1 + i}:0',
+                           f'-metadata:s:s:{i}', f'language={code}',
+                           f'-metadata:s:s:{i}', f'title={language}']
+    output_options += ['-c:a', 'aac', '-b:a', '192k', '-c:s', 'mov_text', '-t', str(duration)]
+
+    output_dir = os.path.dirname(os.path.abspath(merged_path))
+    os.makedirs(output_dir, exist_ok=True)
+
+    try:
+        run_ffmpeg([*inputs, *output_options, '-c:v', 'copy', merged_path])
+    except RuntimeError as e:
+        print(f"Could not copy the video stream ({e}), encoding it once with libx264")
+        run_ffmpeg([*inputs, *output_options, '-c:v', 'libx264', '-preset', 'medium', merged_path])
+
+    print(f"Successfully merged video with {len(languages)} audio tracks to: {merged_path}")
+    return merged_path
+
+
+def render_voiceover_video(video_path, audio_tracks, video_volume=1.0, audio_volume=1.0, subtitle_tracks=None,
+                           acquire=False):
+    """
+    Merges a video with one or more voiceovers, reusing a stored render for identical input.
+
+    With a single voiceover this is merge_video_with_audio; with several it is
+    merge_video_with_audio_tracks. Inputs are identified by their artifact keys,
+    so the same upload and audio on any replica find the same render.
+
+    Args:
+        video_path (str): Path to the uploaded video in the artifact store
+        audio_tracks (dict): Language name -> voiceover audio path in the artifact store
+        video_volume (float): Volume of the original video audio
+        audio_volume (float): Volume of the voiceovers
+        subtitle_tracks (dict, optional): Language name -> caption path (or None)
+        acquire (bool): Take a reference on the merged video (see cached_artifact)
+
+    Returns:
+        str: path of the merged video in the artifact store
+    """
+    subtitle_tracks = subtitle_tracks or {}
+    key = artifact_store.derive_key(
+        'merged',
+        artifact_store.hash_file(video_path),
+        [(language, artifact_store.hash_file(path)) for language, path in audio_tracks.items()],
+        [(language, artifact_store.hash_file(path)) for language, path in subtitle_tracks.items() if path],
+        video_volume,
+        audio_volume,
+    )
+
+    def render(merged_path):
+        if len(audio_tracks) > 1:
+            merge_video_with_audio_tracks(video_path, audio_tracks, merged_path, video_volume, audio_volume, subtitle_tracks)
+        else:
+            language, audio_path = next(iter(audio_tracks.items()))
+            merge_video_with_audio(video_path, audio_path, merged_path, video_volume, audio_volume,
+                                   subtitle_tracks.get(language), language=language_code(language))
+
+    return cached_artifact(key, 'merged', '.mp4', render, acquire=acquire)
+
+
+# Preview renditions: small enough to stream to the browser on every rerun
+PROXY_MAX_HEIGHT = 480
+PROXY_VIDEO_BITRATE = '600k'
+
+# Proxies are rendered in the background; jobs are keyed by artifact key so concurrent
+# requests for the same video share one render
+_proxy_executor = None
+_proxy_jobs = {}
+_proxy_lock = threading.Lock()
+# Key -> error of renders that failed, so a video that cannot be rendered is not retried on every rerun
+_proxy_failures = {}
+
+
+def generate_proxy_video(video_path, proxy_path, max_height=PROXY_MAX_HEIGHT, video_bitrate=PROXY_VIDEO_BITRATE):
+    """
+    Renders a low-bitrate H.264/AAC rendition of a video for in-browser preview.
+
+    Videos taller than max_height are scaled down (keeping the aspect ratio), and
+    the moov atom is moved to the front so playback starts before the file is loaded.
+
+    Parameters:
+    ----------
+    video_path : str
+        Path to the full-quality video.
+    proxy_path : str
+        Path to write the proxy MP4 to.
+    max_height : int, optional
+        Maximum height of the proxy in pixels (default is PROXY_MAX_HEIGHT).
+    video_bitrate : str, optional
+        Target video bitrate for ffmpeg (default is PROXY_VIDEO_BITRATE).
+
+    Returns:
+    -------
+    str
+        Path to the proxy video.
+    """
+    run_ffmpeg([
+        '-i', video_path,
+        '-map', '0:v:0', '-map', '0:a?',
+        '-vf', f"scale=-2:'min({max_height},ih)':flags=fast_bilinear",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', video_bitrate, '-maxrate', video_bitrate, '-bufsize', '1M',
+        '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '96k', '-ac', '2',
+        '-movflags', '+faststart',
+        proxy_path,
+    ])
+    return proxy_path
+
+
+def request_proxy_video(video_path, acquire=False):
+    """
+    Returns a preview proxy for a video, starting a background render if there is none yet.
+
+    Proxies are kept in the artifact store next to the originals, keyed by the
+    original's content hash, so each video is only rendered once across sessions
+    and replicas. A failed render is remembered for the life of the process, and
+    later requests for the same video return "failed" without rendering again.
+
+    Args:
+        video_path (str): Path to the full-quality video
+        acquire (bool): Take a reference on the proxy when it is ready (see cached_artifact)
+
+    Returns:
+        tuple: (status, path) where status is "ready" (path is the proxy), "pending"
+            (path is None) or "failed" (path is the original, to preview as a fallback)
+    """
+    global _proxy_executor
+    key = artifact_store.derive_key('proxy', artifact_store.hash_file(video_path), PROXY_MAX_HEIGHT, PROXY_VIDEO_BITRATE)
+    proxy_path = artifact_store.get(key, acquire=acquire)
+    if proxy_path is not None:
+        return "ready", proxy_path
+
+    with _proxy_lock:
+        if key in _proxy_failures:
+            return "failed", video_path
+        job = _proxy_jobs.get(key)
+        if job is None:
+            if _proxy_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _proxy_executor = ThreadPoolExecutor(max_workers=2)
+            job = _proxy_executor.submit(cached_artifact, key, 'proxy', '.mp4',
+                                         lambda path: generate_proxy_video(video_path, path))
+            _proxy_jobs[key] = job
+    if not job.done():
+        return "pending", None
+
+    with _proxy_lock:
+        if _proxy_jobs.pop(key, None) is job and job.exception() is not None:
+            _proxy_failures[key] = str(job.exception())
+            print(f"Error generating preview proxy: {job.exception()}")
+    if job.exception() is not None:
+        return "failed", video_path
+    # Look the finished render up again so the reference is taken atomically
+    proxy_path = artifact_store.get(key, acquire=acquire)
+    if proxy_path is None:
+        return "pending", None  # already evicted; the next request renders it again
+    return "ready", proxy_path
+
+
+def mux_subtitles(video_path, subtitle_path, output_path, language='eng'):
+    """
+    Adds a subtitle file to a video as a soft (selectable) subtitle track.
+
+    All existing streams are copied rather than re-encoded, so this takes seconds
+    even for long videos.
+
+    Parameters:
+    ----------
+    video_path : str
+        Path to the input MP4.
+    subtitle_path : str
+        Path to an .srt or .vtt file.
+    output_path : str
+        Path to write the MP4 with subtitles to. Must differ from video_path.
+    language : str, optional
+        ISO 639-2 language code to tag the subtitle track with (default is 'eng').
+
+    Returns:
+    -------
+    str
+        Path to the output video.
+    """
+    run_ffmpeg([
+        '-i', video_path,
+        '-i', subtitle_path,
+        '-map', '0', '-map', '1',
+        '-c', 'copy', '-c:s', 'mov_text',
+        '-metadata:s:s:0', f'language={language}',
+        output_path,
+    ])
+    return output_path
+
+
+# Volume previews cover the start of the video at a sample rate that is cheap to re-mix
+VOLUME_PREVIEW_SECONDS = 30
+VOLUME_PREVIEW_SAMPLE_RATE = 22050
+
+
+def load_volume_preview_tracks(video_path, audio_path, seconds=VOLUME_PREVIEW_SECONDS,
+                               sample_rate=VOLUME_PREVIEW_SAMPLE_RATE):
+    """
+    Decodes the start of the original and voiceover audio once, for repeated re-mixing.
+
+    Args:
+        video_path (str): Path to the video file
+        audio_path (str): Path to the voiceover audio
+        seconds (float): How much of the start of the video to preview
+        sample_rate (int): Sample rate to decode at
+
+    Returns:
+        dict: "original" and "voiceover" mono float32 arrays of equal length, and "sample_rate"
+    """
+    import numpy as np
+
+    info = probe_media(video_path)
+    length = int(min(seconds, info['duration']) * sample_rate)
+
+    def fit(samples):
+        fitted = np.zeros(length, dtype=np.float32)
+        fitted[:min(length, len(samples))] = samples[:length]
+        return fitted
+
+    original = decode_audio(video_path, sample_rate, duration=seconds) if info.get('audio_found') else np.zeros(0)
+    voiceover = decode_audio(audio_path, sample_rate, duration=seconds)
+    return {"original": fit(original), "voiceover": fit(voiceover), "sample_rate": sample_rate}
+
+
+def mix_volume_preview(tracks, video_volume=1.0, audio_volume=1.0, video_path=None):
+    """
+    Mixes preview tracks at the given volumes into a short clip to play against the picture.
+
+    This is the same mix merge_video_with_audio produces, on the arrays from
+    load_volume_preview_tracks. The mix is muxed onto the start of video_path
+    (normally the preview proxy) with the video stream copied, not re-encoded,
+    so it takes a fraction of a second.
+
+    Args:
+        tracks (dict): As returned by load_volume_preview_tracks
+        video_volume (float): Volume of the original video audio
+        audio_volume (float): Volume of the voiceover
+        video_path (str, optional): MP4 to take the picture from; without it only the audio is returned
+
+    Returns:
+        bytes: MP4 of the preview, or MP3 of the mix if video_path is None
+    """
+    import numpy as np
+
+    mix = tracks["original"] * video_volume + tracks["voiceover"] * audio_volume
+    np.clip(mix, -1.0, 1.0, out=mix)
+    if video_path is None:
+        return encode_audio(mix, tracks["sample_rate"])
+    return mux_audio_samples(video_path, mix, tracks["sample_rate"], duration=len(mix) / tracks["sample_rate"])
+
+
+# Videos at least this long (in seconds) are merged with merge_video_with_audio_streaming
+STREAMING_MERGE_MIN_DURATION = 10 * 60
+
+
+def merge_video_with_audio_streaming(video_path, audio_path, merged_path, video_volume=1.0, audio_volume=1.0,
+                                     subtitle_path=None, language='eng', window_seconds=1.0, sample_rate=44100):
+    """
+    Merges a video with an audio file in bounded memory, for long-form video.
+
+    Both audio tracks are decoded by ffmpeg into pipes and mixed here one window of
+    `window_seconds` at a time, and each mixed window is piped straight into the
+    encoder. The video stream is copied packet by packet (or, if its codec cannot
+    go into MP4, re-encoded with libx264, which also streams). No track is ever
+    materialized in full, so memory use does not depend on the length of the video.
+
+    Peak memory: each window allocates five buffers of window_seconds *
+    sample_rate * 8 bytes (~350 KB at the defaults): for each of the two decoders,
+    the bytes read from its pipe and the zero-padded array they are copied into,
+    plus the bytes of the mix written to the encoder. The mix is scaled and summed
+    in place, and at most three of these buffers are alive at once, so on top of
+    the interpreter this process holds about 1 MB whatever the length of the video.
+    The three ffmpeg child processes only hold their demuxer/codec buffers and the
+    64 KB pipes between them, a fixed amount set by the codecs (and, when
+    re-encoding, the x264 lookahead), plus the MP4 muxer's per-packet sample
+    tables, which are small next to the media. tests/test_streaming_merge.py checks
+    that peak RSS stays flat from a short clip to an hour-long one.
+
+    Parameters:
+    ----------
+    video_path, audio_path, merged_path, video_volume, audio_volume, subtitle_path, language
+        As for merge_video_with_audio.
+    window_seconds : float, optional
+        Length of each mixing window in seconds (default is 1.0).
+    sample_rate : int, optional
+        Sample rate of the mixed audio in Hz (default is 44100).
+
+    Returns:
+    -------
+    str
+        Path to the merged video file.
+    """
+    import subprocess
+    import numpy as np
+
+    channels = 2
+    info = probe_media(video_path)
+    total_samples = int(round(info['duration'] * sample_rate))
+    window_samples = max(1, int(window_seconds * sample_rate))
+
+    output_dir = os.path.dirname(os.path.abspath(merged_path))
+    os.makedirs(output_dir, exist_ok=True)
+
+    def encode(video_codec):
+        """Runs one merge attempt; returns None on success or the encoder's error output."""
+        cmd = [FFMPEG_BINARY, '-y', '-hide_banner', '-loglevel', 'error',
+               '-i', video_path,
+               '-f', 'f32le', '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0']
+        if subtitle_path is not None:
+            cmd += ['-i', subtitle_path]
+        cmd += ['-map', '0:v:0', '-map', '1:a:0', '-metadata:s:a:0', f'language={language}']
+        if subtitle_path is not None:
+            cmd += ['-map', '2:0', '-c:s', 'mov_text', '-metadata:s:s:0', f'language={language}']
+        cmd += ['-c:v', video_codec, '-c:a', 'aac', '-b:a', '192k', merged_path]
+
+        streams = []
+        # stderr goes to a file so a chatty encoder can never block on a full pipe
+        with tempfile.TemporaryFile() as encoder_log:
+            encoder = None
+            try:
+                # A decoder that fails makes read_pcm_window raise, rather than leaving the track silent
+                original = open_pcm_stream(video_path, sample_rate, channels) if info.get('audio_found') else None
+                streams.append(original)
+                voiceover = open_pcm_stream(audio_path, sample_rate, channels)
+                streams.append(voiceover)
+                encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=encoder_log)
+                written = 0
+                while written < total_samples:
+                    n = min(window_samples, total_samples - written)
+                    mix = read_pcm_window(voiceover, n, channels)
+                    mix *= audio_volume
+                    if original is not None:
+                        original_window = read_pcm_window(original, n, channels)
+                        original_window *= video_volume
+                        mix += original_window
+                    np.clip(mix, -1.0, 1.0, out=mix)
+                    encoder.stdin.write(mix.tobytes())
+                    written += n
+            except BrokenPipeError:
+                pass  # the encoder failed; its log is returned below
+            finally:
+                for stream in streams:
+                    if stream is not None:
+                        close_pcm_stream(stream)
+                if encoder is not None:
+                    try:
+                        encoder.stdin.close()
+                    except BrokenPipeError:
+                        pass
+                    encoder.wait()
+            if encoder.returncode != 0:
+                encoder_log.seek(0)
+                return encoder_log.read().decode('utf-8', errors='replace').strip()
+        return None
+
+    # Only an encoder failure is worth retrying; decoder failures have already raised
+    error = encode('copy')
+    if error is not None:
+        print(f"Could not copy the video stream ({error}), re-encoding it with libx264")
+        error = encode('libx264')
+        if error is not None:
+            raise RuntimeError(f"ffmpeg failed: {error}")
+
+    print(f"Successfully merged video and audio to: {merged_path}")
+    return merged_path
+
+
+def merge_video_with_audio(video_path, audio_path, merged_path, video_volume=1.0, audio_volume=1.0, subtitle_path=None,
+                           language='eng', streaming=None):
     """
     Merges a video with an audio file and allows controlling both the video and audio volume levels.
     Uses a version-independent approach that should work with most MoviePy versions.
@@ -176,6 +1017,16 @@ def merge_video_with_audio(video_path, audio_path, merged_path, video_volume=1.0
     audio_volume : float, optional
         Volume level for the added audio track (default is 1.0, which keeps the original volume).
         Values greater than 1.0 increase volume, less than 1.0 decrease volume.
+    subtitle_path : str, optional
+        Path to an .srt or .vtt file to include as a soft subtitle track. The
+        subtitles are added by stream copy, without re-encoding the video again.
+    language : str, optional
+        ISO 639-2 code of the voiceover's language, used to tag the audio and
+        subtitle tracks (default is 'eng').
+    streaming : bool, optional
+        Use merge_video_with_audio_streaming, whose memory use does not grow with
+        the length of the video. If None (the default), it is used for videos of
+        at least STREAMING_MERGE_MIN_DURATION seconds.
         
     Returns:
     -------
@@ -185,6 +1036,12 @@ def merge_video_with_audio(video_path, audio_path, merged_path, video_volume=1.0
     import os
     from moviepy import VideoFileClip, AudioFileClip, CompositeAudioClip
     
+    if streaming is None:
+        streaming = probe_media(video_path)['duration'] >= STREAMING_MERGE_MIN_DURATION
+    if streaming:
+        return merge_video_with_audio_streaming(video_path, audio_path, merged_path, video_volume, audio_volume,
+                                                subtitle_path, language)
+    
     try:
         # Load the video
         video_clip = VideoFileClip(video_path)
@@ -230,13 +1087,20 @@ def merge_video_with_audio(video_path, audio_path, merged_path, video_volume=1.0
         if output_dir and not os.path.exists(output_dir):
             os.makedirs(output_dir, exist_ok=True)
         
+        # When adding subtitles, encode to a temporary file first and copy it into the final one
+        encode_path = merged_path
+        if subtitle_path is not None:
+            root, extension = os.path.splitext(merged_path)
+            encode_path = f"{root}.nosubs{extension}"
+        
         # Write the final video to the specified path
         final_clip.write_videofile(
-            merged_path,
+            encode_path,
             codec='libx264',
             audio_codec='aac',
-            temp_audiofile='temp-audio.m4a',
+            temp_audiofile=f"{os.path.splitext(encode_path)[0]}.temp-audio.m4a",  # per output, so concurrent merges don't collide
             remove_temp=True,
+            ffmpeg_params=['-metadata:s:a:0', f'language={language}'],
             logger=None     # Suppress logger output
         )
         
@@ -247,6 +1111,12 @@ def merge_video_with_audio(video_path, audio_path, merged_path, video_volume=1.0
             original_audio.close()
         final_clip.close()
         
+        if subtitle_path is not None:
+            try:
+                mux_subtitles(encode_path, subtitle_path, merged_path, language)
+            finally:
+                os.remove(encode_path)
+        
         print(f"Successfully merged video and audio to: {merged_path}")
         return merged_path
         
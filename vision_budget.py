@@ -0,0 +1,258 @@
+# Standard library imports
+import math
+import threading
+
+# Local imports
+from genai import estimate_tokens
+
+
+class VisionBudgeter:
+    """
+    Chooses how many frames to send to a vision model, and at what size and detail
+    level, so that a request stays under an input-token and/or latency ceiling.
+
+    Image token costs follow OpenAI's published accounting: a "low" detail image is
+    a fixed base cost, and a "high" detail image is the base cost plus a per-tile
+    cost for every 512px tile after the image is fitted into 2048x2048 and its
+    shortest side scaled down to 768px. Estimates are then corrected by comparing
+    them against the `usage` returned by the API for previous requests.
+
+    Attributes:
+    ----------
+    model : str
+        The vision model the requests will be sent to.
+    max_input_tokens : int or None
+        Ceiling on the estimated prompt tokens of a request.
+    max_latency_s : float or None
+        Ceiling on the estimated wall-clock time of a request, in seconds.
+    token_scale : float
+        Calibrated ratio of actual to estimated prompt tokens.
+    latency_scale : float
+        Calibrated ratio of actual to estimated request latency.
+    """
+
+    # (base tokens, tokens per 512px tile) for each model family
+    IMAGE_TOKEN_COSTS = {
+        'gpt-4o-mini': (2833, 5667),
+        'gpt-4o': (85, 170),
+        'gpt-4.1': (85, 170),
+    }
+    DEFAULT_IMAGE_TOKEN_COSTS = (85, 170)
+
+    # Candidate encodings, from most to least detailed: (detail, longest side in px, JPEG quality)
+    ENCODINGS = [
+        ('high', 1024, 85),
+        ('high', 768, 80),
+        ('high', 512, 75),
+        ('low', 512, 70),
+    ]
+
+    # Starting guesses for the latency model, refined by `record`
+    BASE_LATENCY_S = 1.5
+    SECONDS_PER_INPUT_TOKEN = 0.0002
+    SECONDS_PER_OUTPUT_TOKEN = 0.01
+
+    # Weight given to each new observation when updating the calibration
+    CALIBRATION_RATE = 0.3
+
+    def __init__(self, model='gpt-4o-mini', max_input_tokens=None, max_latency_s=None,
+                 min_frames=4, max_frames=10, max_output_tokens=1000):
+        """
+        Initializes the budgeter.
+
+        Parameters:
+        ----------
+        model : str, optional
+            The vision model the requests will be sent to (default is 'gpt-4o-mini').
+        max_input_tokens : int, optional
+            Ceiling on the estimated prompt tokens of a request.
+        max_latency_s : float, optional
+            Ceiling on the estimated wall-clock time of a request, in seconds.
+        min_frames : int, optional
+            Fewest frames worth sending; detail is reduced before going below this (default is 4).
+        max_frames : int, optional
+            Most frames to send (default is 10).
+        max_output_tokens : int, optional
+            The `max_tokens` to request for the response (default is 1000).
+        """
+        self.model = model
+        self.max_input_tokens = max_input_tokens
+        self.max_latency_s = max_latency_s
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.max_output_tokens = max_output_tokens
+        self.token_scale = 1.0
+        self.latency_scale = 1.0
+        self.history = []
+        # Requests (e.g. the windows of a long video) are planned and recorded from several threads
+        self._lock = threading.Lock()
+
+    def _image_token_costs(self):
+        # Longest matching prefix, so 'gpt-4o-mini-2024-07-18' is not priced as 'gpt-4o'
+        for name in sorted(self.IMAGE_TOKEN_COSTS, key=len, reverse=True):
+            if self.model.startswith(name):
+                return self.IMAGE_TOKEN_COSTS[name]
+        return self.DEFAULT_IMAGE_TOKEN_COSTS
+
+    @staticmethod
+    def resized_dimensions(width, height, max_side):
+        """
+        Returns the dimensions of an image scaled down so its longest side is at most `max_side`.
+
+        Images that already fit are left at their original size.
+        """
+        scale = min(1.0, max_side / max(width, height))
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def estimate_image_tokens(self, width, height, detail):
+        """
+        Estimates the prompt tokens a single image will cost before calibration.
+
+        Parameters:
+        ----------
+        width, height : int
+            Dimensions of the image as sent.
+        detail : str
+            'low' or 'high'.
+
+        Returns:
+        -------
+        int
+            Estimated tokens for the image.
+        """
+        base_tokens, tile_tokens = self._image_token_costs()
+        if detail == 'low':
+            return base_tokens
+
+        # Fit within 2048x2048, then scale the shortest side down to 768
+        scale = min(1.0, 2048 / max(width, height))
+        width, height = width * scale, height * scale
+        scale = min(1.0, 768 / min(width, height))
+        width, height = width * scale, height * scale
+
+        tiles = math.ceil(width / 512) * math.ceil(height / 512)
+        return base_tokens + tile_tokens * tiles
+
+    def estimate_latency(self, input_tokens, n=1):
+        """
+        Estimates the wall-clock time of a request with the given prompt size, in seconds.
+
+        `n` is the number of choices requested; each can produce up to
+        `max_output_tokens`, so output time is budgeted for all of them.
+        """
+        return self._raw_latency(input_tokens, n) * self.latency_scale
+
+    def _raw_latency(self, input_tokens, n=1):
+        return (self.BASE_LATENCY_S
+                + self.SECONDS_PER_INPUT_TOKEN * input_tokens
+                + self.SECONDS_PER_OUTPUT_TOKEN * n * self.max_output_tokens)
+
+    def _fits(self, candidate, n, latency_scale):
+        if self.max_input_tokens is not None and candidate['estimated_input_tokens'] > self.max_input_tokens:
+            return False
+        # Frames only change the input side of the estimate; if generating `n` choices
+        # alone exceeds the latency ceiling, dropping frames cannot meet it
+        if (self.max_latency_s is not None and self._raw_latency(0, n) * latency_scale <= self.max_latency_s
+                and candidate['estimated_latency_s'] > self.max_latency_s):
+            return False
+        return True
+
+    def plan(self, source_size, instructions="", n=1, max_frames=None):
+        """
+        Picks the frame count and image encoding for a request.
+
+        Encodings are tried from most to least detailed; the first one that fits at
+        least `min_frames` frames under the ceilings is used, with as many frames as
+        fit. If nothing fits, the least detailed encoding is used with as many frames
+        as fit (at least one), so a request is always possible.
+
+        Parameters:
+        ----------
+        source_size : tuple
+            (width, height) of the source frames.
+        instructions : str, optional
+            The text prompt sent alongside the images.
+        n : int, optional
+            Number of choices the request will ask for (default is 1).
+        max_frames : int, optional
+            Most frames the caller will send, if fewer than the budgeter's own
+            `max_frames`; the plan is sized for no more than this.
+
+        Returns:
+        -------
+        dict
+            The plan, with keys 'frames', 'detail', 'size', 'jpeg_quality',
+            'max_tokens', 'estimated_input_tokens' and 'estimated_latency_s', plus
+            'raw_input_tokens' and 'raw_latency_s', the same estimates before
+            calibration, which `record` compares the actual cost against.
+        """
+        text_tokens = estimate_tokens(instructions) + 10  # plus message framing overhead
+        # One consistent calibration for the whole plan, even if another thread records meanwhile
+        with self._lock:
+            token_scale, latency_scale = self.token_scale, self.latency_scale
+        max_frames = self.max_frames if max_frames is None else max(1, min(max_frames, self.max_frames))
+        min_frames = min(self.min_frames, max_frames)
+
+        def build(frames, detail, max_side, jpeg_quality):
+            size = self.resized_dimensions(*source_size, max_side)
+            per_image = self.estimate_image_tokens(*size, detail)
+            raw_input_tokens = text_tokens + frames * per_image
+            input_tokens = round(raw_input_tokens * token_scale)
+            raw_latency_s = self._raw_latency(input_tokens, n)
+            return {
+                'frames': frames,
+                'detail': detail,
+                'size': size,
+                'jpeg_quality': jpeg_quality,
+                'max_tokens': self.max_output_tokens,
+                'estimated_input_tokens': input_tokens,
+                'estimated_latency_s': raw_latency_s * latency_scale,
+                'raw_input_tokens': raw_input_tokens,
+                'raw_latency_s': raw_latency_s,
+            }
+
+        for detail, max_side, jpeg_quality in self.ENCODINGS:
+            for frames in range(max_frames, min_frames - 1, -1):
+                candidate = build(frames, detail, max_side, jpeg_quality)
+                if self._fits(candidate, n, latency_scale):
+                    return candidate
+
+        detail, max_side, jpeg_quality = self.ENCODINGS[-1]
+        for frames in range(min_frames - 1, 0, -1):
+            candidate = build(frames, detail, max_side, jpeg_quality)
+            if self._fits(candidate, n, latency_scale):
+                return candidate
+        return build(1, detail, max_side, jpeg_quality)
+
+    def record(self, plan, usage, latency_s):
+        """
+        Records the actual cost of a request made with `plan`, to calibrate future estimates.
+
+        Parameters:
+        ----------
+        plan : dict
+            The plan returned by `plan` that the request was made with.
+        usage : object
+            The `usage` of the API completion (needs a `prompt_tokens` attribute).
+        latency_s : float
+            Measured wall-clock time of the request, in seconds.
+        """
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        rate = self.CALIBRATION_RATE
+        # Compare against the plan's own uncalibrated estimates: the scales may have moved since it
+        # was made (concurrent requests are recorded in any order)
+        with self._lock:
+            if prompt_tokens and plan['raw_input_tokens']:
+                ratio = prompt_tokens / plan['raw_input_tokens']
+                self.token_scale = (1 - rate) * self.token_scale + rate * ratio
+            if latency_s and plan['raw_latency_s']:
+                ratio = latency_s / plan['raw_latency_s']
+                self.latency_scale = (1 - rate) * self.latency_scale + rate * ratio
+
+            self.history.append({
+                'estimated_input_tokens': plan['estimated_input_tokens'],
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': getattr(usage, 'completion_tokens', None),
+                'estimated_latency_s': plan['estimated_latency_s'],
+                'latency_s': latency_s,
+            })